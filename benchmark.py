@@ -0,0 +1,445 @@
+"""
+Benchmark harness for the Fifteen puzzle solver
+Generates seeded random solvable boards, times solve_puzzle and its
+phases, and writes the results as JSON so that runs can be compared
+
+    python benchmark.py --sizes 3 4 5 --depths 20 200 random --output run.json
+    python benchmark.py --compare old.json run.json
+    python benchmark.py --startup
+    python benchmark.py --large
+    python benchmark.py --corpus corpus.json
+    python benchmark.py --check
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from user43_xyNEfInWuR_23 import Puzzle, SolverStats, _neighbour_table, build_distance_table
+
+# modules the lean path (import, Puzzle(h, w), solve_puzzle) must not load
+LAZY_MODULES = ("mmap", "multiprocessing", "numpy")
+
+# run in a fresh interpreter by startup(); prints one JSON line
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from user43_xyNEfInWuR_23 import Puzzle
+imported = time.perf_counter()
+puzzle = Puzzle(%(size)d, %(size)d, %(grid)r)
+created = time.perf_counter()
+puzzle.solve_puzzle()
+solved = time.perf_counter()
+print(json.dumps({"import": imported - start, "create": created - imported,
+                  "first_solve": solved - created,
+                  "loaded": [name for name in %(lazy)r if name in sys.modules]}))
+"""
+
+# run in a fresh interpreter by large(); prints one JSON line. Peak RSS
+# comes from resource, which only exists on Unix
+LARGE_SCRIPT = """
+import json, sys, time
+try:
+    import resource
+except ImportError:
+    resource = None
+from user43_xyNEfInWuR_23 import Puzzle
+puzzle = Puzzle(%(size)d, %(size)d, %(grid)r)
+start = time.perf_counter()
+moves = 0
+for chunk in puzzle.iter_solution():
+    moves += len(chunk)
+elapsed = time.perf_counter() - start
+peak = None
+if resource != None:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak *= 1024
+print(json.dumps({"seconds": elapsed, "moves": moves, "peak_rss_bytes": peak,
+                  "solved": puzzle._solved_from == 0}))
+"""
+
+# budgets the --large check holds a 100x100 random board to
+LARGE_SECONDS = 60.0
+LARGE_RSS_BYTES = 256 * 1024 * 1024
+
+# board sizes, boards per size and weights of the --check cross-check
+CHECK_SIZES = ((3, 3), (2, 4))
+CHECK_WEIGHTS = (1.5, 2.0, 3.0)
+
+PHASES = ("solve_interior_tile", "solve_col0_tile", "solve_row1_tile",
+          "solve_row0_tile", "solve_2x2")
+
+
+def scrambled_grid(height, width, depth, rng):
+    """
+    A solvable board: the solved board after depth random blank moves
+    that never undo the previous one, or, for depth "random", a uniformly
+    random permutation with its parity fixed by one swap of two tiles
+    Returns a 2D list
+    """
+    size = height * width
+    if depth == "random":
+        cells = list(range(size))
+        rng.shuffle(cells)
+        puzzle = Puzzle(height, width, [cells[row * width:(row + 1) * width]
+                                        for row in range(height)])
+        if not puzzle.is_solvable():
+            tiles = [offset for offset, tile in enumerate(cells) if tile != 0]
+            cells[tiles[0]], cells[tiles[1]] = cells[tiles[1]], cells[tiles[0]]
+    else:
+        neighbours = _neighbour_table(height, width)
+        cells = list(range(size))
+        blank = 0
+        previous = None
+        for dummy_move in range(depth):
+            choices = [target for dummy_direction, target in neighbours[blank]
+                       if target != previous]
+            target = rng.choice(choices)
+            cells[blank], cells[target] = cells[target], 0
+            previous, blank = blank, target
+    return [cells[row * width:(row + 1) * width] for row in range(height)]
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a non-empty list
+    Returns a number
+    """
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(math.ceil(fraction * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def run_case(height, width, depth, boards, seed):
+    """
+    Solve boards seeded boards of one size and scramble depth
+    Returns a dictionary of measurements
+    """
+    rng = random.Random("%d:%dx%d:%s" % (seed, height, width, depth))
+    grids = [scrambled_grid(height, width, depth, rng) for dummy_board in range(boards)]
+
+    latencies = []
+    lengths = []
+    failures = {}
+    started = time.perf_counter()
+    for grid in grids:
+        puzzle = Puzzle(height, width, grid)
+        start = time.perf_counter()
+        try:
+            moves = puzzle.solve_puzzle()
+        except Exception as error:
+            failures[type(error).__name__] = failures.get(type(error).__name__, 0) + 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        lengths.append(len(moves))
+    elapsed = time.perf_counter() - started
+
+    # phase profile and memory come from separate passes, so that neither
+    # the profiling nor the tracing skews the timings above
+    stats = SolverStats()
+    for grid in grids:
+        puzzle = Puzzle(height, width, grid)
+        puzzle.enable_stats(stats)
+        try:
+            puzzle.solve_puzzle()
+        except Exception:
+            pass
+    counters = stats.as_dict()
+
+    tracemalloc.start()
+    for grid in grids:
+        try:
+            Puzzle(height, width, grid).solve_puzzle()
+        except Exception:
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "height": height,
+        "width": width,
+        "depth": depth,
+        "boards": boards,
+        "solved": len(latencies),
+        "failures": failures,
+        "boards_per_sec": boards / elapsed if elapsed else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000 if latencies else None,
+            "p99": percentile(latencies, 0.99) * 1000 if latencies else None,
+        },
+        "avg_moves": sum(lengths) / float(len(lengths)) if lengths else None,
+        "peak_memory_bytes": peak,
+        "phases": dict((name, {"calls": counters.get(name, {}).get("calls", 0),
+                               "total_ms": counters.get(name, {}).get("seconds", 0.0) * 1000})
+                       for name in PHASES),
+    }
+
+
+def run(sizes, depths, boards, seed):
+    """
+    Benchmark every size (square boards) and scramble depth
+    Returns a dictionary ready for JSON
+    """
+    results = []
+    for size in sizes:
+        for depth in depths:
+            results.append(run_case(size, size, depth, boards, seed))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "seed": seed,
+            "boards": boards,
+        },
+        "results": results,
+    }
+
+
+def compare(old_run, new_run):
+    """
+    Print throughput and latency ratios (new / old) per case
+    """
+    old_cases = dict(((case["height"], case["width"], str(case["depth"])), case)
+                     for case in old_run["results"])
+    for case in new_run["results"]:
+        key = (case["height"], case["width"], str(case["depth"]))
+        old = old_cases.get(key)
+        if old == None or not old["boards_per_sec"] or not old["latency_ms"]["p50"]:
+            continue
+        print("%dx%d depth %-6s  boards/sec x%.2f  p50 x%.2f  p99 x%.2f  moves %s -> %s" % (
+            key[0], key[1], key[2],
+            case["boards_per_sec"] / old["boards_per_sec"],
+            case["latency_ms"]["p50"] / old["latency_ms"]["p50"],
+            case["latency_ms"]["p99"] / old["latency_ms"]["p99"],
+            old["avg_moves"], case["avg_moves"]))
+
+
+def startup(runs, size, depth, seed):
+    """
+    Time, in runs fresh interpreters, importing the solver, creating a
+    size x size Puzzle and its first solve_puzzle of a board scrambled
+    depth moves deep, and list the modules
+    of LAZY_MODULES that got loaded on the way
+    Returns a dictionary ready for JSON
+    """
+    grid = scrambled_grid(size, size, depth, random.Random(seed))
+    script = STARTUP_SCRIPT % {"size": size, "grid": grid, "lazy": LAZY_MODULES}
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for dummy_run in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=here)
+        samples.append(json.loads(output.decode("ascii")))
+    loaded = sorted(set(name for sample in samples for name in sample["loaded"]))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "runs": runs,
+            "size": size,
+            "depth": depth,
+        },
+        "startup_ms": dict((key, {"p50": percentile([sample[key] for sample in samples], 0.50) * 1000,
+                                  "p99": percentile([sample[key] for sample in samples], 0.99) * 1000})
+                           for key in ("import", "create", "first_solve")),
+        "lazy_modules_loaded": loaded,
+    }
+
+
+def large(size, seed):
+    """
+    Solve one seeded uniformly random size x size board with
+    iter_solution in a fresh interpreter, streaming the moves without
+    keeping them, and check the time and peak memory against
+    LARGE_SECONDS and LARGE_RSS_BYTES
+    Returns a dictionary ready for JSON
+    """
+    grid = scrambled_grid(size, size, "random", random.Random(seed))
+    script = LARGE_SCRIPT % {"size": size, "grid": grid}
+    here = os.path.dirname(os.path.abspath(__file__))
+    sample = json.loads(subprocess.check_output([sys.executable, "-c", script],
+                                                cwd=here).decode("ascii"))
+    within = (sample["solved"] and sample["seconds"] <= LARGE_SECONDS and
+              (sample["peak_rss_bytes"] == None or sample["peak_rss_bytes"] <= LARGE_RSS_BYTES))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "size": size,
+            "seed": seed,
+        },
+        "seconds": sample["seconds"],
+        "us_per_tile": sample["seconds"] * 1e6 / (size * size - 1),
+        "moves": sample["moves"],
+        "peak_rss_bytes": sample["peak_rss_bytes"],
+        "solved": sample["solved"],
+        "budget": {"seconds": LARGE_SECONDS, "peak_rss_bytes": LARGE_RSS_BYTES},
+        "within_budget": within,
+    }
+
+
+def corpus(path):
+    """
+    Solve every board of a corpus file, a JSON list of [height, width,
+    grid] entries, with solve_puzzle and replay each solution on the
+    starting board
+    Returns a dictionary ready for JSON
+    """
+    with open(path) as in_file:
+        boards = json.load(in_file)
+    failures = []
+    moves = 0
+    for height, width, grid in boards:
+        puzzle = Puzzle(height, width, grid)
+        try:
+            solution = puzzle.clone().solve_puzzle()
+            assert puzzle.replay(solution).verify(), "solution does not solve the board"
+        except Exception as error:
+            failures.append({"height": height, "width": width, "grid": grid,
+                             "error": type(error).__name__ + ": " + str(error)})
+            continue
+        moves += len(solution)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "corpus": path,
+        },
+        "boards": len(boards),
+        "solved": len(boards) - len(failures),
+        "total_moves": moves,
+        "failures": failures,
+    }
+
+
+def check(boards, seed):
+    """
+    Cross-check the shortest solvers on seeded random 3x3 and 2x4
+    boards: solve_optimal, solve_bidirectional, solve_from_table,
+    solve_parallel(workers=1) and solve_weighted(1.0) must find
+    solutions of the same length, solve_weighted(weight) one at most
+    weight times as long, and every solution must solve its board
+    Returns a dictionary ready for JSON
+    """
+    failures = []
+    checked = 0
+    for height, width in CHECK_SIZES:
+        table = build_distance_table(height, width)
+        rng = random.Random("%d:check:%dx%d" % (seed, height, width))
+        for dummy_board in range(boards):
+            grid = scrambled_grid(height, width, "random", rng)
+            puzzle = Puzzle(height, width, grid)
+            solutions = {
+                "solve_optimal": puzzle.clone().solve_optimal(),
+                "solve_bidirectional": puzzle.clone().solve_bidirectional(),
+                "solve_from_table": puzzle.clone().solve_from_table(table),
+                "solve_parallel": puzzle.clone().solve_parallel(workers=1),
+                "solve_weighted(1.0)": puzzle.clone().solve_weighted(1.0),
+            }
+            shortest = len(solutions["solve_optimal"])
+            problems = ["%s: %d moves" % (name, len(moves))
+                        for name, moves in sorted(solutions.items()) if len(moves) != shortest]
+            for weight in CHECK_WEIGHTS:
+                moves = puzzle.clone().solve_weighted(weight)
+                solutions["solve_weighted(%g)" % weight] = moves
+                if len(moves) > weight * shortest:
+                    problems.append("solve_weighted(%g): %d moves" % (weight, len(moves)))
+            problems += [name + ": does not solve the board"
+                         for name, moves in sorted(solutions.items())
+                         if not puzzle.replay(moves).verify()]
+            if problems:
+                failures.append({"height": height, "width": width, "grid": grid,
+                                 "shortest": shortest, "problems": problems})
+            checked += 1
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "seed": seed,
+            "sizes": ["%dx%d" % size for size in CHECK_SIZES],
+            "weights": list(CHECK_WEIGHTS),
+        },
+        "boards": checked,
+        "failures": failures,
+    }
+
+
+def _depth(text):
+    """
+    argparse type for scramble depths
+    """
+    return text if text == "random" else int(text)
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(range(3, 11)),
+                        help="square board sizes (default 3 to 10)")
+    parser.add_argument("--depths", type=_depth, nargs="+", default=[20, 200, "random"],
+                        help="scramble depths in moves, or 'random'")
+    parser.add_argument("--boards", type=int, default=20, help="boards per case")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two JSON runs instead of benchmarking")
+    parser.add_argument("--startup", type=int, nargs="?", const=20, metavar="RUNS",
+                        help="time import and first solve in RUNS fresh interpreters "
+                             "(default 20) on the first of --sizes and --depths instead; fails if "
+                             "a lazily loaded module was imported")
+    parser.add_argument("--large", type=int, nargs="?", const=100, metavar="SIZE",
+                        help="solve one random SIZE x SIZE board (default 100) with "
+                             "iter_solution instead; fails if it is not solved within "
+                             "LARGE_SECONDS and LARGE_RSS_BYTES")
+    parser.add_argument("--corpus", metavar="PATH",
+                        help="solve and replay every board of a JSON corpus instead; "
+                             "fails if any board is not solved")
+    parser.add_argument("--check", action="store_true",
+                        help="cross-check the shortest solvers on --boards seeded 3x3 "
+                             "and 2x4 boards instead; fails on any disagreement")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            compare(json.load(old_file), json.load(new_file))
+        return
+
+    if args.startup:
+        report = startup(args.startup, args.sizes[0], args.depths[0], args.seed)
+    elif args.large:
+        report = large(args.large, args.seed)
+    elif args.corpus:
+        report = corpus(args.corpus)
+    elif args.check:
+        report = check(args.boards, args.seed)
+    else:
+        report = run(args.sizes, args.depths, args.boards, args.seed)
+    if args.output:
+        with open(args.output, "w") as out_file:
+            json.dump(report, out_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    if args.startup and report["lazy_modules_loaded"]:
+        sys.exit("lean path loaded " + ", ".join(report["lazy_modules_loaded"]))
+    if args.large and not report["within_budget"]:
+        sys.exit("large board not solved within budget")
+    if args.check and report["failures"]:
+        sys.exit("%d of %d boards failed the cross-check" % (len(report["failures"]),
+                                                           report["boards"]))
+    if args.corpus and report["failures"]:
+        sys.exit("%d of %d corpus boards failed" % (len(report["failures"]), report["boards"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Asyncio solve service for the Fifteen puzzle solver
+Serves newline-delimited JSON over TCP or a Unix socket; each request
+
+    {"id": 7, "grid": [[1, 3], [2, 0]], "method": "phased", "timeout": 5}
+
+("method" and "timeout" are optional) is answered by one line
+
+    {"id": 7, "moves": "ulur...", "error": null}
+
+in completion order. Each request runs on its own solver process; one
+that overruns its timeout is terminated and replaced, so a hard board
+cannot hold a process or delay the boards behind it. A bounded queue
+stops reading from clients while every process is busy
+
+    python server.py --port 8715
+    python server.py --unix /tmp/fifteen.sock --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from user43_xyNEfInWuR_23 import _BATCH_METHODS, _init_solve_worker, _solve_job
+
+# longest request line accepted, in bytes
+LINE_LIMIT = 1 << 24
+
+
+def _serve_jobs(conn, pattern_db_path):
+    """
+    Solver process loop: answer _solve_job jobs from conn until it closes
+    """
+    _init_solve_worker(pattern_db_path)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        conn.send(_solve_job(job))
+
+
+class _SolverProcess:
+    """
+    One solver process and the pipe to it. Processes are spawned rather
+    than forked, so they do not inherit (and keep open) the sockets of
+    connected clients
+    """
+
+    __slots__ = ("_conn", "_process")
+
+    def __init__(self, pattern_db_path):
+        """
+        Start the process; it maps the pattern database, if any
+        """
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=_serve_jobs, args=(child_conn, pattern_db_path),
+                                        daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def solve(self, job, timeout):
+        """
+        Run one _solve_job job, blocking for at most timeout seconds
+        Returns a _solve_job result, or None when the process overran or died
+        """
+        try:
+            self._conn.send(job)
+            if self._conn.poll(timeout):
+                return self._conn.recv()
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def stop(self):
+        """
+        Terminate the process, whatever it is doing
+        """
+        self._process.terminate()
+        self._process.join()
+        self._conn.close()
+
+
+class SolveService:
+    """
+    Front end to a set of solver processes. Requests wait in a queue of
+    queue_size and each goes to the next idle process, so submit blocks
+    while every process is busy and the queue is full. A process still
+    solving when its request times out is terminated and replaced
+    """
+
+    def __init__(self, workers=None, pattern_db_path=None, queue_size=1024, timeout=10.0):
+        """
+        Configure the service; start() creates the processes
+        """
+        self._workers = workers
+        self._pattern_db_path = pattern_db_path
+        self._queue_size = queue_size
+        self.timeout = timeout
+        self._queue = None
+        self._threads = None
+        self._dispatchers = []
+
+    async def start(self):
+        """
+        Start one solver process, and the task feeding it, per worker
+        """
+        workers = self._workers or multiprocessing.cpu_count()
+        self._queue = asyncio.Queue(self._queue_size)
+        # each dispatcher waits on its process's pipe in a thread of its own
+        self._threads = ThreadPoolExecutor(workers)
+        self._dispatchers = [asyncio.ensure_future(self._dispatch(_SolverProcess(self._pattern_db_path)))
+                             for dummy_worker in range(workers)]
+
+    async def close(self):
+        """
+        Stop dispatching and terminate the solver processes, including
+        any still solving
+        """
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+        self._threads.shutdown(wait=False)
+
+    async def submit(self, grid, method="phased", timeout=None):
+        """
+        Queue a board, waiting while the queue is full; it is given
+        timeout seconds from now (the service default when None)
+        Returns a future of a (move string or None, error or None) tuple
+        """
+        assert method in _BATCH_METHODS, "unknown method: " + str(method)
+        if timeout == None:
+            timeout = self.timeout
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # answers the request at its deadline even while it is still queued
+        loop.call_later(timeout, self._expire, future, timeout)
+        await self._queue.put(((0, grid, method), future, timeout, time.monotonic() + timeout))
+        return future
+
+    def _expire(self, future, timeout):
+        """
+        Answer a request that is not done by its deadline
+        """
+        if not future.done():
+            future.set_result((None, "timed out after %g seconds" % timeout))
+
+    async def solve(self, grid, method="phased", timeout=None):
+        """
+        Solve one board on a solver process
+        Returns a tuple (move string or None, error message or None)
+        """
+        future = await self.submit(grid, method, timeout)
+        return await future
+
+    async def _dispatch(self, process):
+        """
+        Feed queued requests to one solver process, forever, replacing
+        the process when it overruns a request's deadline or dies
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                job, future, timeout, deadline = await self._queue.get()
+                if future.done():
+                    continue
+                result = None
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    result = await loop.run_in_executor(self._threads, process.solve, job, remaining)
+                if result == None and remaining > 0:
+                    await loop.run_in_executor(self._threads, process.stop)
+                    process = _SolverProcess(self._pattern_db_path)
+                if future.done():
+                    continue
+                if result != None:
+                    future.set_result(result[1:])
+                elif time.monotonic() >= deadline:
+                    self._expire(future, timeout)
+                else:
+                    future.set_result((None, "solver process died"))
+        finally:
+            process.stop()
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve one client: read requests until it disconnects, answering
+        each as soon as it is solved
+        """
+        lock = asyncio.Lock()
+        replies = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._send(writer, lock, None, None, "request line too long")
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    grid = request["grid"]
+                    method = request.get("method", "phased")
+                    timeout = request.get("timeout")
+                    assert method in _BATCH_METHODS, "unknown method: " + str(method)
+                    assert timeout == None or timeout > 0, "timeout must be positive"
+                except (ValueError, TypeError, KeyError, AttributeError, AssertionError) as error:
+                    await self._send(writer, lock, request_id, None,
+                                     "bad request: " + type(error).__name__ + ": " + str(error))
+                    continue
+                future = await self.submit(grid, method, timeout)
+                reply = asyncio.ensure_future(self._reply(writer, lock, request_id, future))
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+            if replies:
+                await asyncio.gather(*replies)
+        except ConnectionError:
+            pass
+        finally:
+            for reply in replies:
+                reply.cancel()
+            writer.close()
+
+    async def _reply(self, writer, lock, request_id, future):
+        """
+        Wait for one request and send its answer
+        """
+        move_string, error = await future
+        await self._send(writer, lock, request_id, move_string, error)
+
+    async def _send(self, writer, lock, request_id, move_string, error):
+        """
+        Write one response line
+        """
+        async with lock:
+            writer.write(json.dumps({"id": request_id, "moves": move_string,
+                                     "error": error}).encode() + b"\n")
+            await writer.drain()
+
+
+async def serve(service, host="127.0.0.1", port=8715, unix_path=None):
+    """
+    Run service on a TCP port, or on a Unix socket when unix_path is
+    given, until cancelled
+    """
+    await service.start()
+    try:
+        if unix_path != None:
+            server = await asyncio.start_unix_server(service.handle_connection, unix_path,
+                                                     limit=LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(service.handle_connection, host, port,
+                                                limit=LINE_LIMIT)
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8715)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, help="solver processes (default one per core)")
+    parser.add_argument("--pattern-db", help="pattern database file for method 'optimal'")
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="default per-request timeout in seconds")
+    args = parser.parse_args(argv)
+
+    service = SolveService(args.workers, args.pattern_db, args.queue_size, args.timeout)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,914 @@ Use the arrows key to swap this tile with its neighbors
 
 #import poc_fifteen_gui
 
+# mmap, multiprocessing, random and numpy are imported where they are
+# first needed, so importing the module, making a Puzzle and solve_puzzle
+# load nothing beyond these
+import heapq
+import math
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+def _cell_typecode(size):
+    """
+    Pick the smallest array typecode that holds tile values 0 .. size - 1:
+    one, two or four bytes per tile, the same on every platform
+    Returns a string
+    """
+    if size <= 256:
+        return "B"
+    elif size <= 65536:
+        return "H"
+    return "I"
+
+
+_INVERSE_MOVE = {"l": "r", "r": "l", "u": "d", "d": "u"}
+
+# the move codes used by packed moves, distance tables and batch boards,
+# and the (row, col) step of the blank for each
+_MOVES = "udlr"
+_MOVE_STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def _offset_steps(width):
+    """
+    How far each move takes the blank along the flat board
+    Returns a dictionary mapping each direction to an offset step
+    """
+    return dict((direction, step_row * width + step_col)
+                for direction, (step_row, step_col) in zip(_MOVES, _MOVE_STEPS))
+
+# hard caps on the phased solver's loops, per unit of height + width
+_ITERATION_BUDGET = 4
+_MOVE_BUDGET = 60
+
+# how often the phases assert their invariants, per validation mode
+_VALIDATION_SAMPLE_RATE = 0.05
+_VALIDATION_RATES = {"off": 0.0, "sampled": _VALIDATION_SAMPLE_RATE, "full": 1.0}
+
+# default cap on the reachable states of boards given to solve_bidirectional
+_BIDIRECTIONAL_STATES = 2000000
+# default cap on the boards kept by solve_weighted
+_WEIGHTED_STATES = 2000000
+
+# moves between the board snapshots of a SolutionReplay (a multiple of 4,
+# so snapshots fall on packed byte boundaries)
+_REPLAY_INTERVAL = 4096
+
+
+class _MoveBuffer:
+    """
+    Collects the move chunks of one solver call so they are joined into
+    a string once, instead of re-copying a growing string per chunk;
+    with keep False it only counts them
+    """
+
+    __slots__ = ("_chunks", "count")
+
+    def __init__(self, keep=True):
+        """
+        Start empty
+        """
+        self._chunks = [] if keep else None
+        self.count = 0
+
+    def add(self, moves):
+        """
+        Append a move string
+        """
+        if self._chunks != None:
+            self._chunks.append(moves)
+        self.count += len(moves)
+
+    def join(self):
+        """
+        All moves so far
+        Returns a string
+        """
+        return "".join(self._chunks)
+
+
+class SolverBudgetError(Exception):
+    """
+    Raised when a phase of the phased solver runs past its move or
+    iteration budget, or finds a board it cannot make progress on
+    """
+    pass
+
+
+def _corner_solutions():
+    """
+    Breadth-first search over the 12 reachable arrangements of the upper
+    left 2x2 corner, with the tiles 0, 1, width, width + 1 ranked 0 to 3
+    in reading order
+    Returns a dictionary mapping each arrangement to its shortest solution
+    """
+    neighbours = _neighbour_table(2, 2)
+    solutions = {(0, 1, 2, 3): ""}
+    queue = [(0, 1, 2, 3)]
+    for state in queue:
+        blank = state.index(0)
+        for direction, target in neighbours[blank]:
+            cells = list(state)
+            cells[blank], cells[target] = cells[target], 0
+            cells = tuple(cells)
+            if cells not in solutions:
+                solutions[cells] = _INVERSE_MOVE[direction] + solutions[state]
+                queue.append(cells)
+    return solutions
+
+
+def _neighbour_table(height, width):
+    """
+    List, for every blank offset, the (direction, new blank offset)
+    pairs of the moves allowed from there
+    Returns a list of lists of tuples
+    """
+    table = []
+    for offset in range(height * width):
+        row, col = divmod(offset, width)
+        moves = []
+        for direction, (step_row, step_col) in zip(_MOVES, _MOVE_STEPS):
+            if 0 <= row + step_row < height and 0 <= col + step_col < width:
+                moves.append((direction, offset + step_row * width + step_col))
+        table.append(moves)
+    return table
+
+
+_SOLUTIONS_2X2 = _corner_solutions()
+
+
+def _loop_macros():
+    """
+    Rewrite rules for the blank circling a 2x2 or 2x3 block. A lap
+    cycles the other tiles of the block, so order laps (3 for 2x2, 5 for
+    2x3) are a no-op and k laps equal order - k laps the other way round
+    Returns a dictionary mapping each long move string to its shortcut
+    """
+    laps = []
+    for height, width in ((2, 2), (2, 3), (3, 2)):
+        border = ("r" * (width - 1) + "d" * (height - 1)
+                  + "l" * (width - 1) + "u" * (height - 1))
+        order = len(border) - 1
+        for start in range(len(border)):
+            lap = border[start:] + border[:start]
+            laps.append((lap, order))
+            laps.append(("".join(_INVERSE_MOVE[move] for move in reversed(lap)), order))
+
+    macros = {}
+    for lap, order in laps:
+        back = "".join(_INVERSE_MOVE[move] for move in reversed(lap))
+        for count in range(2, order + 1):
+            if len(back) * (order - count) < len(lap) * count:
+                macros[lap * count] = back * (order - count)
+    return macros
+
+
+_MOVE_MACROS = _loop_macros()
+_MACRO_LENGTHS = sorted(set(len(pattern) for pattern in _MOVE_MACROS))
+
+
+def optimize_moves(moves):
+    """
+    Shorten a move string (or any iterable of moves) without changing
+    the board it leads to. Moves are pushed one at a time onto a stack:
+    a move that undoes the one on top cancels it, and a stack tail that
+    matches a _MOVE_MACROS loop is replaced by its shortcut, whose moves
+    are pushed back through the same rules
+    Returns a string
+    """
+    stack = []
+    pending = list(moves)
+    pending.reverse()
+    while pending:
+        move = pending.pop()
+        if stack and stack[-1] == _INVERSE_MOVE[move]:
+            stack.pop()
+            continue
+        stack.append(move)
+        for length in _MACRO_LENGTHS:
+            if length > len(stack):
+                break
+            tail = "".join(stack[-length:])
+            if tail in _MOVE_MACROS:
+                del stack[-length:]
+                pending.extend(reversed(_MOVE_MACROS[tail]))
+                break
+    return "".join(stack)
+
+
+# macro tables of the phased solver, built on first use by
+# _build_macro_table and keyed by its arguments
+_MACRO_TABLES = {}
+# rows and columns the phased solver's macro windows reach around their
+# center cell
+_MACRO_RADIUS = 3
+
+
+def _build_macro_table(height, width, free, goal, ends, borrowed):
+    """
+    Breadth-first search backwards from the end states of a window of
+    height x width cells, where the bits of free mark the cells the
+    blank may use: the tracked tile at goal (or no tracked tile when
+    goal is None), the blank on one of the ends and every borrowed
+    cell's tile back home. Other tiles are not tracked, so each macro
+    is a shortest one for the tiles that matter
+    Returns a dictionary mapping (tile, blank) window offsets (tile None
+    when untracked) to move strings
+    """
+    size = height * width
+    moves_from = [[(direction, target) for direction, target in choices
+                   if free >> target & 1]
+                  for choices in _neighbour_table(height, width)]
+    # states are integers with one base-size digit per tracked cell:
+    # the blank, then the tile (if any), then the borrowed tiles
+    cells = [None] + ([] if goal == None else [goal]) + list(borrowed)
+    scale = size ** (len(cells) - len(borrowed))
+    homes = sum(cell * size ** idx for idx, cell in enumerate(borrowed))
+    solutions = {}
+    queue = []
+    for end in ends:
+        cells[0] = end
+        state = sum(cell * size ** idx for idx, cell in enumerate(cells))
+        solutions[state] = ""
+        queue.append(state)
+    powers = [size ** idx for idx in range(1, len(cells))]
+    for state in queue:
+        blank = state % size
+        moves = solutions[state]
+        for direction, target in moves_from[blank]:
+            # the tracked tile on target, if any, slides onto blank
+            child = state - blank + target
+            for power in powers:
+                if state // power % size == target:
+                    child += (blank - target) * power
+                    break
+            if child not in solutions:
+                solutions[child] = _INVERSE_MOVE[direction] + moves
+                queue.append(child)
+
+    table = {}
+    for state, moves in solutions.items():
+        if state // scale == homes:
+            table[(None if goal == None else state // size % size, state % size)] = moves
+    return table
+
+
+def _macro_table(height, width, free, goal, ends, borrowed):
+    """
+    The _build_macro_table table for these arguments, built once
+    Returns a dictionary
+    """
+    key = (height, width, free, goal, ends, borrowed)
+    table = _MACRO_TABLES.get(key)
+    if table == None:
+        table = _MACRO_TABLES[key] = _build_macro_table(height, width, free, goal,
+                                                        ends, borrowed)
+    return table
+
+
+def _toward(source, dest):
+    """
+    Step of -1, 0 or 1 that takes source closer to dest
+    Returns an integer
+    """
+    return (dest > source) - (dest < source)
+
+
+def _pack_board(cells):
+    """
+    Pack a board into one integer with a bit field of
+    (len(cells) - 1).bit_length() bits per cell, cell 0 in the lowest
+    Returns an integer
+    """
+    bits = (len(cells) - 1).bit_length()
+    state = 0
+    for offset, tile in enumerate(cells):
+        state |= tile << (bits * offset)
+    return state
+
+
+def _slide(state, blank, target, bits, mask):
+    """
+    Move the tile at offset target of a packed board into the blank at
+    offset blank
+    Returns the new packed board
+    """
+    shift = bits * target
+    tile = (state >> shift) & mask
+    return state - (tile << shift) + (tile << (bits * blank))
+
+
+def _walk_back(seen, state, blank, width, bits, mask, field=None):
+    """
+    Follow seen, which maps each packed board to the direction of the
+    blank's last move into it (None at the root) or, with field, to a
+    tuple holding that direction at index field, from state back to the
+    root
+    Returns the blank's moves from the root as a list, last move first
+    """
+    step = _offset_steps(width)
+    moves = []
+    direction = seen[state] if field == None else seen[state][field]
+    while direction != None:
+        moves.append(direction)
+        previous = blank - step[direction]
+        state = _slide(state, blank, previous, bits, mask)
+        blank = previous
+        direction = seen[state] if field == None else seen[state][field]
+    return moves
+
+
+def _manhattan_table(height, width):
+    """
+    Manhattan distance of every tile from every offset to its solved
+    offset, indexed by tile * size + offset (zero for the blank)
+    Returns a list of integers
+    """
+    size = height * width
+    table = [0] * (size * size)
+    for tile in range(1, size):
+        goal_row, goal_col = divmod(tile, width)
+        for offset in range(size):
+            row, col = divmod(offset, width)
+            table[tile * size + offset] = abs(row - goal_row) + abs(col - goal_col)
+    return table
+
+
+def _line_conflicts(goals):
+    """
+    Linear-conflict penalty for one row or column, given the solved
+    coordinates along that line of the tiles that belong to it, in board
+    order. Every tile outside the longest increasing run has to step out
+    of the line and back, which costs two extra moves
+    Returns an integer
+    """
+    tails = []
+    for goal in goals:
+        idx = bisect_left(tails, goal)
+        if idx == len(tails):
+            tails.append(goal)
+        else:
+            tails[idx] = goal
+    return 2 * (len(goals) - len(tails))
+
+
+def _row_conflicts(cells, width, row):
+    """
+    Linear-conflict penalty of one row of a flat board
+    Returns an integer
+    """
+    start = row * width
+    return _line_conflicts([tile - start for tile in cells[start:start + width]
+                            if tile and start <= tile < start + width])
+
+
+def _col_conflicts(cells, width, col):
+    """
+    Linear-conflict penalty of one column of a flat board
+    Returns an integer
+    """
+    return _line_conflicts([tile // width for tile in cells[col::width]
+                            if tile and tile % width == col])
+
+
+def _placement_count(size, count):
+    """
+    Number of ways to place count distinct tiles on size cells
+    Returns an integer
+    """
+    total = 1
+    for idx in range(count):
+        total *= size - idx
+    return total
+
+
+def _placement_rank(positions, size):
+    """
+    Index of a placement of distinct tiles (their offsets, in pattern
+    order) among all _placement_count(size, len(positions)) placements
+    Returns an integer
+    """
+    rank = 0
+    for idx, offset in enumerate(positions):
+        smaller = 0
+        for earlier in positions[:idx]:
+            if earlier < offset:
+                smaller += 1
+        rank = rank * (size - idx) + offset - smaller
+    return rank
+
+
+def _placement_unrank(rank, count, size):
+    """
+    Inverse of _placement_rank for count tiles
+    Returns a list of offsets
+    """
+    digits = []
+    for idx in range(count - 1, -1, -1):
+        rank, digit = divmod(rank, size - idx)
+        digits.append(digit)
+    free = list(range(size))
+    return [free.pop(digit) for digit in reversed(digits)]
+
+
+def _count_inversions(values, size):
+    """
+    Count the pairs that appear out of order in values (distinct integers
+    in 0 .. size - 1), using a Fenwick tree of the values seen so far
+    Returns an integer
+    """
+    tree = [0] * (size + 1)
+    inversions = 0
+    for seen, value in enumerate(values):
+        idx = value + 1
+        not_larger = 0
+        while idx > 0:
+            not_larger += tree[idx]
+            idx -= idx & -idx
+        inversions += seen - not_larger
+        idx = value + 1
+        while idx <= size:
+            tree[idx] += 1
+            idx += idx & -idx
+    return inversions
+
+
+class _ConflictEstimate:
+    """
+    Manhattan distance plus linear conflicts, kept up to date move by
+    move during a search over a flat list board
+    """
+
+    __slots__ = ("_width", "_size", "_distance", "_row_lc", "_col_lc",
+                 "_saved", "initial")
+
+    def __init__(self, cells, height, width):
+        """
+        Measure the starting board
+        """
+        self._width = width
+        self._size = height * width
+        self._distance = _manhattan_table(height, width)
+        self._row_lc = [_row_conflicts(cells, width, row) for row in range(height)]
+        self._col_lc = [_col_conflicts(cells, width, col) for col in range(width)]
+        self._saved = []
+        self.initial = (sum(self._distance[tile * self._size + offset]
+                            for offset, tile in enumerate(cells))
+                        + sum(self._row_lc) + sum(self._col_lc))
+
+    def move(self, cells, tile, source, dest):
+        """
+        Account for tile having moved from source to dest in cells
+        Returns the change of the estimate
+        """
+        width = self._width
+        change = (self._distance[tile * self._size + dest]
+                  - self._distance[tile * self._size + source])
+
+        # only the lines the tile leaves and enters can change their
+        # conflicts, and only if it belongs to one of them
+        if source % width == dest % width:
+            lines, old_line, new_line = self._row_lc, source // width, dest // width
+            if tile // width != old_line and tile // width != new_line:
+                self._saved.append(None)
+                return change
+            new_old = _row_conflicts(cells, width, old_line)
+            new_new = _row_conflicts(cells, width, new_line)
+        else:
+            lines, old_line, new_line = self._col_lc, source % width, dest % width
+            if tile % width != old_line and tile % width != new_line:
+                self._saved.append(None)
+                return change
+            new_old = _col_conflicts(cells, width, old_line)
+            new_new = _col_conflicts(cells, width, new_line)
+        self._saved.append((lines, old_line, new_line,
+                            lines[old_line], lines[new_line]))
+        change += new_old + new_new - lines[old_line] - lines[new_line]
+        lines[old_line] = new_old
+        lines[new_line] = new_new
+        return change
+
+    def undo(self, dummy_tile):
+        """
+        Forget the most recent move
+        """
+        saved = self._saved.pop()
+        if saved != None:
+            lines, old_line, new_line, old_value, new_value = saved
+            lines[old_line] = old_value
+            lines[new_line] = new_value
+
+
+class _PatternEstimate:
+    """
+    Sum of disjoint pattern database lookups (plus the Manhattan distance
+    of any tile outside every pattern), kept up to date move by move
+    """
+
+    __slots__ = ("_db", "_size", "_distance", "_group_of", "_slot_of",
+                 "_positions", "_values", "_saved", "initial")
+
+    def __init__(self, cells, pattern_db):
+        """
+        Measure the starting board
+        """
+        height, width = pattern_db.get_size()
+        self._db = pattern_db
+        self._size = height * width
+        self._distance = _manhattan_table(height, width)
+        self._group_of = [-1] * self._size
+        self._slot_of = [0] * self._size
+        self._positions = []
+        for group, tiles in enumerate(pattern_db.get_groups()):
+            for slot, tile in enumerate(tiles):
+                self._group_of[tile] = group
+                self._slot_of[tile] = slot
+            self._positions.append([cells.index(tile) for tile in tiles])
+        self._values = [pattern_db.lookup(group, positions)
+                        for group, positions in enumerate(self._positions)]
+        self._saved = []
+        self.initial = sum(self._values) + sum(
+            self._distance[tile * self._size + offset]
+            for offset, tile in enumerate(cells) if self._group_of[tile] == -1)
+
+    def move(self, dummy_cells, tile, source, dest):
+        """
+        Account for tile having moved from source to dest
+        Returns the change of the estimate
+        """
+        group = self._group_of[tile]
+        if group == -1:
+            return (self._distance[tile * self._size + dest]
+                    - self._distance[tile * self._size + source])
+        self._positions[group][self._slot_of[tile]] = dest
+        old_value = self._values[group]
+        self._saved.append((source, old_value))
+        self._values[group] = self._db.lookup(group, self._positions[group])
+        return self._values[group] - old_value
+
+    def undo(self, tile):
+        """
+        Forget the most recent move
+        """
+        group = self._group_of[tile]
+        if group != -1:
+            source, old_value = self._saved.pop()
+            self._positions[group][self._slot_of[tile]] = source
+            self._values[group] = old_value
+
+
+class _SearchStopped(Exception):
+    """
+    Raised inside a _bounded_search probe once its stop flag is set
+    """
+
+
+def _bounded_search(cells, neighbours, estimator, path, stop=None):
+    """
+    Build the depth-first probe of IDA* over the board in cells (a flat
+    list, changed in place and restored). The probe appends its moves to
+    path, which holds a solution once it reports success. With stop, a
+    shared multiprocessing Value, it raises _SearchStopped soon after
+    stop.value is set
+    Returns a function search(blank, depth, bound, estimate, previous)
+    """
+    expanded = [0]
+
+    def search(blank, depth, bound, estimate, previous):
+        """
+        Depth-first probe of every path whose cost stays within bound
+        Returns -1 when solved, else the smallest cost over bound
+        """
+        cost = depth + estimate
+        if cost > bound:
+            return cost
+        if estimate == 0:
+            return -1
+        if stop != None:
+            expanded[0] += 1
+            if expanded[0] & 4095 == 0 and stop.value:
+                raise _SearchStopped()
+        smallest = None
+        for direction, target in neighbours[blank]:
+            if direction == previous:
+                continue
+            tile = cells[target]
+            cells[blank] = tile
+            cells[target] = 0
+            change = estimator.move(cells, tile, target, blank)
+
+            path.append(direction)
+            result = search(target, depth + 1, bound, estimate + change,
+                            _INVERSE_MOVE[direction])
+            if result == -1:
+                return -1
+            path.pop()
+
+            # undo the move in place
+            cells[target] = tile
+            cells[blank] = 0
+            estimator.undo(tile)
+            if result != None and (smallest == None or result < smallest):
+                smallest = result
+        return smallest
+
+    return search
+
+
+# disjoint tile groups for the blank-at-(0, 0) goal layout
+_PATTERN_GROUPS = {
+    (4, 4): ((3, 6, 7, 10, 11, 15), (1, 2, 4, 5, 8, 9), (12, 13, 14)),
+    (5, 5): ((1, 2, 5, 6, 7, 12), (3, 4, 8, 9, 13, 14),
+             (10, 11, 15, 16, 20, 21), (17, 18, 19, 22, 23, 24)),
+}
+
+_PDB_MAGIC = b"FPDB"
+_PDB_VERSION = 1
+
+
+class PatternDatabase:
+    """
+    Disjoint additive pattern databases for one board size. Each group
+    has a table holding, for every placement of its tiles, the fewest
+    moves of those tiles needed to bring them home
+    """
+
+    __slots__ = ("_height", "_width", "_groups", "_offsets", "_data")
+
+    def __init__(self, height, width, groups, data):
+        """
+        Wrap the tables of groups, stored back to back in data (a
+        bytearray or a read-only mmap)
+        Returns a PatternDatabase object
+        """
+        self._height = height
+        self._width = width
+        self._groups = tuple(tuple(tiles) for tiles in groups)
+        self._data = data
+        self._offsets = []
+        offset = len(data)
+        for tiles in reversed(self._groups):
+            offset -= _placement_count(height * width, len(tiles))
+            self._offsets.insert(0, offset)
+
+    def get_size(self):
+        """
+        Board height and width the tables were built for
+        Returns a tuple of two integers
+        """
+        return (self._height, self._width)
+
+    def get_groups(self):
+        """
+        Tile groups, in table order
+        Returns a tuple of tuples of integers
+        """
+        return self._groups
+
+    def lookup(self, group, positions):
+        """
+        Moves needed by the tiles of group, found at positions (offsets
+        in the order of the group's tiles)
+        Returns an integer
+        """
+        return self._data[self._offsets[group]
+                          + _placement_rank(positions, self._height * self._width)]
+
+    def save(self, path):
+        """
+        Write the header and tables to path
+        """
+        header = bytearray(_PDB_MAGIC)
+        header.extend(struct.pack("<BBBB", _PDB_VERSION, self._height,
+                                  self._width, len(self._groups)))
+        for tiles in self._groups:
+            header.append(len(tiles))
+            header.extend(tiles)
+        with open(path, "wb") as out_file:
+            out_file.write(header)
+            out_file.write(self._data[self._offsets[0]:])
+
+
+def build_pattern_database(height, width, groups=None):
+    """
+    Generate the tables for disjoint tile groups (by default the split
+    in _PATTERN_GROUPS for this board size) breadth first from the
+    solved board, counting only moves of each group's own tiles.
+    Pure Python, so the 6-tile groups of the 4x4 and 5x5 splits are an
+    offline job; keep the result with PatternDatabase.save
+    Returns a PatternDatabase object
+    """
+    if groups == None:
+        groups = _PATTERN_GROUPS[(height, width)]
+    data = bytearray()
+    for tiles in groups:
+        data.extend(_build_pattern_table(height, width, tiles))
+    return PatternDatabase(height, width, groups, data)
+
+
+def _build_pattern_table(height, width, tiles):
+    """
+    Breadth-first search over placements of tiles plus the blank, where
+    sliding any other tile is free. Each expanded state first claims the
+    blank's whole free region, so a placement is closed once per region.
+    Frontiers hold packed rank * size + blank integers to bound memory
+    Returns a bytearray indexed by placement rank
+    """
+    size = height * width
+    neighbours = _neighbour_table(height, width)
+    table = bytearray(b"\xff") * _placement_count(size, len(tiles))
+    seen = bytearray((len(table) * size + 7) // 8)
+    frontier = array("Q", [_placement_rank(tiles, size) * size])
+    depth = 0
+    while frontier:
+        next_frontier = array("Q")
+        for state in frontier:
+            if seen[state >> 3] & (1 << (state & 7)):
+                continue
+            rank, blank = divmod(state, size)
+            if table[rank] == 255:
+                table[rank] = depth
+            positions = _placement_unrank(rank, len(tiles), size)
+
+            # flood the blank's region, then push each pattern tile that
+            # borders it into the region
+            base = rank * size
+            seen[state >> 3] |= 1 << (state & 7)
+            region = [blank]
+            for cell in region:
+                for dummy_direction, other in neighbours[cell]:
+                    bit = base + other
+                    if other not in positions and not seen[bit >> 3] & (1 << (bit & 7)):
+                        seen[bit >> 3] |= 1 << (bit & 7)
+                        region.append(other)
+            for cell in region:
+                for dummy_direction, other in neighbours[cell]:
+                    if other in positions:
+                        slot = positions.index(other)
+                        positions[slot] = cell
+                        bit = _placement_rank(positions, size) * size + other
+                        positions[slot] = other
+                        if not seen[bit >> 3] & (1 << (bit & 7)):
+                            next_frontier.append(bit)
+        frontier = next_frontier
+        depth += 1
+    return table
+
+
+def load_pattern_database(path):
+    """
+    Map a file written by PatternDatabase.save read-only into memory;
+    processes that load the same file share one copy of its pages
+    Returns a PatternDatabase object
+    """
+    import mmap
+    with open(path, "rb") as in_file:
+        data = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+    assert data[:4] == _PDB_MAGIC, "not a pattern database: " + str(path)
+    version, height, width, group_count = struct.unpack("<BBBB", data[4:8])
+    assert version == _PDB_VERSION, "unknown pattern database version " + str(version)
+    groups = []
+    offset = 8
+    for dummy_group in range(group_count):
+        count = data[offset]
+        groups.append(tuple(data[offset + 1:offset + 1 + count]))
+        offset += 1 + count
+    return PatternDatabase(height, width, groups, data)
+
+
+# each DistanceTable byte: the distance to the solved board in the low
+# six bits and, in the top two, the blank's next move on a shortest path
+_DISTANCE_MAGIC = b"FDST"
+_DISTANCE_VERSION = 1
+_DISTANCE_UNREACHED = 0xFF
+# bytes of magic, version, height and width in front of the table
+_DISTANCE_HEADER_SIZE = 7
+
+
+class DistanceTable:
+    """
+    Exact distances for every board of one (small) size, indexed by
+    the _placement_rank of the tiles' offsets, so a shortest solution
+    is read off the table one move at a time without any search
+    """
+
+    __slots__ = ("_height", "_width", "_data")
+
+    def __init__(self, height, width, data):
+        """
+        Wrap the table bytes (a bytearray or a read-only mmap)
+        Returns a DistanceTable object
+        """
+        self._height = height
+        self._width = width
+        self._data = data
+
+    def get_size(self):
+        """
+        Board height and width the table was built for
+        Returns a tuple of two integers
+        """
+        return (self._height, self._width)
+
+    def lookup(self, positions):
+        """
+        Distance of the board whose tiles 0, 1, ... are at positions to
+        the solved board, and the blank's first move on a shortest path
+        (None once solved)
+        Returns a tuple (integer, string or None), or None when the
+        board cannot be solved
+        """
+        entry = self._data[_DISTANCE_HEADER_SIZE
+                           + _placement_rank(positions, self._height * self._width)]
+        if entry == _DISTANCE_UNREACHED:
+            return None
+        distance = entry & 63
+        if distance == 0:
+            return (0, None)
+        return (distance, _MOVES[entry >> 6])
+
+    def save(self, path):
+        """
+        Write the table, header included, to path
+        """
+        with open(path, "wb") as out_file:
+            out_file.write(self._data)
+
+
+def build_distance_table(height, width):
+    """
+    Breadth-first search over every board reachable from the solved
+    board, recording each one's distance and the move back towards the
+    solved board. The table has (height * width)! bytes, so this is for
+    boards like 3x3 (362,880 bytes) or 2x4; keep the result with
+    DistanceTable.save
+    Returns a DistanceTable object
+    """
+    size = height * width
+    bits = (size - 1).bit_length()
+    mask = (1 << bits) - 1
+    neighbours = _neighbour_table(height, width)
+    data = bytearray(_DISTANCE_MAGIC + struct.pack("<BBB", _DISTANCE_VERSION, height, width))
+    data.extend(bytes([_DISTANCE_UNREACHED]) * _placement_count(size, size))
+
+    goal = _pack_board(range(size))
+    # states are packed by _pack_board; seen maps each one to the code
+    # of the blank's move back towards the goal
+    seen = {goal: 0}
+    frontier = [(goal, 0)]
+    positions = [0] * size
+    distance = 0
+    while frontier:
+        assert distance < 63, "distances do not fit the table"
+        next_frontier = []
+        for state, blank in frontier:
+            for offset in range(size):
+                positions[(state >> (bits * offset)) & mask] = offset
+            data[_DISTANCE_HEADER_SIZE + _placement_rank(positions, size)] = \
+                distance | seen[state] << 6
+            for direction, target in neighbours[blank]:
+                child = _slide(state, blank, target, bits, mask)
+                if child not in seen:
+                    seen[child] = _MOVES.index(_INVERSE_MOVE[direction])
+                    next_frontier.append((child, target))
+        frontier = next_frontier
+        distance += 1
+    return DistanceTable(height, width, data)
+
+
+def load_distance_table(path):
+    """
+    Map a file written by DistanceTable.save read-only into memory
+    Returns a DistanceTable object
+    """
+    import mmap
+    with open(path, "rb") as in_file:
+        data = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+    assert data[:4] == _DISTANCE_MAGIC, "not a distance table: " + str(path)
+    version, height, width = struct.unpack("<BBB", data[4:_DISTANCE_HEADER_SIZE])
+    assert version == _DISTANCE_VERSION, "unknown distance table version " + str(version)
+    return DistanceTable(height, width, data)
+
+
 class Puzzle:
     """
     Class representation for the Fifteen puzzle
     """
 
+    # the board is one flat row-major array of tiles; _tile_pos is its
+    # inverse (tile value -> offset), so _tile_pos[0] is the blank's offset.
+    # _solved_from is the first offset of the longest solved suffix of the
+    # board and _top_solved_from the first column from which both top rows
+    # are solved; moves keep them exact so the invariants are O(1)
+    __slots__ = ("_height", "_width", "_cells", "_tile_pos", "_stats",
+                 "_solved_from", "_top_solved_from", "_validation")
+
     def __init__(self, puzzle_height, puzzle_width, initial_grid=None):
         """
         Initialize puzzle with default height and width
@@ -18,25 +921,24 @@ class Puzzle:
         """
         self._height = puzzle_height
         self._width = puzzle_width
-        self._grid = [[col + puzzle_width * row
-                       for col in range(self._width)]
-                      for row in range(self._height)]
+        self._cells = array(_cell_typecode(puzzle_height * puzzle_width),
+                            range(puzzle_height * puzzle_width))
 
         if initial_grid != None:
             for row in range(puzzle_height):
                 for col in range(puzzle_width):
-                    self._grid[row][col] = initial_grid[row][col]
+                    self._cells[col + puzzle_width * row] = initial_grid[row][col]
+
+        self._index_tiles()
+        self._stats = None
+        self._validation = _VALIDATION_RATES["full"]
 
     def __str__(self):
         """
         Generate string representaion for puzzle
         Returns a string
         """
-        ans = ""
-        for row in range(self._height):
-            ans += str(self._grid[row])
-            ans += "\n"
-        return ans
+        return "".join(str(self._row(row).tolist()) + "\n" for row in range(self._height))
 
     #####################################
     # GUI methods
@@ -60,25 +962,135 @@ class Puzzle:
         Getter for the number at tile position pos
         Returns an integer
         """
-        return self._grid[row][col]
+        return self._cells[col + self._width * row]
 
     def set_number(self, row, col, value):
         """
         Setter for the number at tile position pos
         """
-        self._grid[row][col] = value
+        offset = col + self._width * row
+        self._cells[offset] = value
+        self._tile_pos[value] = offset
+        self._find_frontiers()
 
     def clone(self):
         """
         Make a copy of the puzzle to update during solving
         Returns a Puzzle object
         """
-        new_puzzle = Puzzle(self._height, self._width, self._grid)
+        new_puzzle = self.__class__.__new__(self.__class__)
+        new_puzzle._height = self._height
+        new_puzzle._width = self._width
+        new_puzzle._cells = self._cells[:]
+        new_puzzle._tile_pos = self._tile_pos[:]
+        new_puzzle._stats = self._stats
+        new_puzzle._solved_from = self._solved_from
+        new_puzzle._top_solved_from = self._top_solved_from
+        new_puzzle._validation = self._validation
         return new_puzzle
 
+    def enable_stats(self, stats, sample_rate=1.0):
+        """
+        Record calls, moves emitted and wall time of the solver methods
+        into stats (a SolverStats) for this puzzle, with probability
+        sample_rate; None switches recording off. The puzzle is switched
+        to a profiling subclass, so an unprofiled Puzzle pays nothing
+        Returns True if recording is on
+        """
+        import random
+        if stats == None or random.random() >= sample_rate:
+            self.__class__ = Puzzle
+            self._stats = None
+            return False
+        self.__class__ = _ProfiledPuzzle
+        self._stats = stats
+        return True
+
+    def set_validation(self, mode, sample_rate=_VALIDATION_SAMPLE_RATE):
+        """
+        Choose how often the solver phases assert their invariants:
+        "full" checks every one, "sampled" a random sample_rate share of
+        them and "off" none
+        """
+        assert mode in _VALIDATION_RATES, "unknown validation mode: " + str(mode)
+        if mode == "sampled":
+            self._validation = sample_rate
+        else:
+            self._validation = _VALIDATION_RATES[mode]
+
+    def _check_invariant(self, invariant, *args):
+        """
+        Assert invariant(*args) unless the validation mode skips it
+        """
+        rate = self._validation
+        if rate >= 1.0:
+            assert invariant(*args), invariant.__name__ + str(args) + " does not hold"
+        elif rate > 0.0:
+            import random
+            if random.random() < rate:
+                assert invariant(*args), invariant.__name__ + str(args) + " does not hold"
+
     ########################################################
     # Core puzzle methods
 
+    def _index_tiles(self):
+        """
+        Rebuild the index from tile value to its offset in _cells
+        """
+        self._tile_pos = array(self._cells.typecode, [0]) * len(self._cells)
+        for offset, value in enumerate(self._cells):
+            self._tile_pos[value] = offset
+        self._find_frontiers()
+
+    def _find_frontiers(self):
+        """
+        Recompute both solved frontiers by scanning the board
+        """
+        cells = self._cells
+        width = self._width
+        solved_from = len(cells)
+        while solved_from > 0 and cells[solved_from - 1] == solved_from - 1:
+            solved_from -= 1
+        self._solved_from = solved_from
+        top = width if self._height > 1 else 0
+        while top > 0 and cells[top - 1] == top - 1 and cells[top - 1 + width] == top - 1 + width:
+            top -= 1
+        self._top_solved_from = top
+
+    def _track_cell(self, offset):
+        """
+        Move the solved frontiers after the tile at offset changed
+        """
+        cells = self._cells
+        if cells[offset] != offset:
+            if offset >= self._solved_from:
+                self._solved_from = offset + 1
+        elif offset == self._solved_from - 1:
+            solved_from = offset
+            while solved_from > 0 and cells[solved_from - 1] == solved_from - 1:
+                solved_from -= 1
+            self._solved_from = solved_from
+
+        width = self._width
+        if offset < 2 * width and self._height > 1:
+            col = offset % width
+            if cells[col] != col or cells[col + width] != col + width:
+                if col >= self._top_solved_from:
+                    self._top_solved_from = col + 1
+            elif col == self._top_solved_from - 1:
+                top = col
+                while top > 0 and cells[top - 1] == top - 1 and cells[top - 1 + width] == top - 1 + width:
+                    top -= 1
+                self._top_solved_from = top
+
+    def _row(self, row):
+        """
+        Copy of one row of the board
+        Returns an array
+        """
+        start = self._width * row
+        return self._cells[start:start + self._width]
+
     def current_position(self, solved_row, solved_col):
         """
         Locate the current position of the tile that will be at
@@ -87,244 +1099,321 @@ class Puzzle:
         """
         solved_value = (solved_col + self._width * solved_row)
 
-        for row in range(self._height):
-            for col in range(self._width):
-                if self._grid[row][col] == solved_value:
-                    return (row, col)
-        assert False, "Value " + str(solved_value) + " not found"
+        offset = self._tile_pos[solved_value]
+        if self._cells[offset] != solved_value:
+            # index lost track of the value (duplicate set_number), rescan
+            assert solved_value in self._cells, "Value " + str(solved_value) + " not found"
+            offset = self._cells.index(solved_value)
+            self._tile_pos[solved_value] = offset
+        return divmod(offset, self._width)
+
+    def is_solvable(self):
+        """
+        Check whether the solved configuration (blank at (0, 0)) can be
+        reached. Sliding the blank sideways keeps the inversion count of
+        the tiles in reading order, sliding it up or down changes it by
+        width - 1 tiles, so inversions + (width - 1) * blank row keeps its
+        parity, and it is even when solved
+        Returns a boolean
+        """
+        size = len(self._cells)
+        for value in range(size):
+            if self._cells[self._tile_pos[value]] != value:
+                # not a permutation of 0 .. size - 1
+                return False
+
+        inversions = _count_inversions([tile for tile in self._cells if tile != 0], size)
+        if self._height == 1 or self._width == 1:
+            # tiles in a single line can never pass each other
+            return inversions == 0
+        zero_row = self._tile_pos[0] // self._width
+        return (inversions + (self._width - 1) * zero_row) % 2 == 0
 
     def update_puzzle(self, move_string):
         """
         Updates the puzzle state based on the provided move string
         """
-        zero_row, zero_col = self.current_position(0, 0)
-        for direction in move_string:
-            if direction == "l":
-                assert zero_col > 0, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row][zero_col - 1]
-                self._grid[zero_row][zero_col - 1] = 0
-                zero_col -= 1
-            elif direction == "r":
-                assert zero_col < self._width - 1, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row][zero_col + 1]
-                self._grid[zero_row][zero_col + 1] = 0
-                zero_col += 1
-            elif direction == "u":
-                assert zero_row > 0, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row - 1][zero_col]
-                self._grid[zero_row - 1][zero_col] = 0
-                zero_row -= 1
-            elif direction == "d":
-                assert zero_row < self._height - 1, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row + 1][zero_col]
-                self._grid[zero_row + 1][zero_col] = 0
-                zero_row += 1
-            else:
-                assert False, "invalid direction: " + direction
+        self.update_puzzle_from(self.current_position(0, 0), move_string)
 
-    ##################################################################
-    # Phase one methods
+    def update_puzzle_from(self, zero_pos, move_string):
+        """
+        Updates the puzzle state based on the provided move string, for
+        callers that already know the blank is at zero_pos
+        Returns the new blank position as a tuple of two integers
+        """
+        zero_row, zero_col = zero_pos
+        cells = self._cells
+        tile_pos = self._tile_pos
+        width = self._width
+        last_row = len(cells) - width
+        top_rows = 2 * width
+        zero = zero_col + width * zero_row
+        assert cells[zero] == 0, "blank is not at " + str(zero_pos)
+        try:
+            for direction in move_string:
+                if direction == "l":
+                    assert zero % width > 0, "move off grid: " + direction
+                    target = zero - 1
+                elif direction == "r":
+                    assert zero % width < width - 1, "move off grid: " + direction
+                    target = zero + 1
+                elif direction == "u":
+                    assert zero >= width, "move off grid: " + direction
+                    target = zero - width
+                elif direction == "d":
+                    assert zero < last_row, "move off grid: " + direction
+                    target = zero + width
+                else:
+                    assert False, "invalid direction: " + direction
+                tile = cells[target]
+                cells[zero] = tile
+                cells[target] = 0
+                tile_pos[tile] = zero
+                # only cells at the edge of the solved suffix or in the
+                # top two rows can move a frontier
+                if zero < top_rows or zero >= self._solved_from - 1:
+                    self._track_cell(zero)
+                if target < top_rows or target >= self._solved_from - 1:
+                    self._track_cell(target)
+                zero = target
+        finally:
+            tile_pos[0] = zero
+        return divmod(zero, width)
 
-    def lower_row_invariant(self, target_row, target_col):
+    def replay(self, moves, interval=_REPLAY_INTERVAL):
         """
-        Check whether the puzzle satisfies the specified invariant
-        at the given position in the bottom rows of the puzzle (target_row > 1)
-        Returns a boolean
+        Replay engine for a solution of this board: moves is a move
+        string or the bytes written by encode_moves. The puzzle is not
+        updated
+        Returns a SolutionReplay object
         """
-        if self._grid[target_row][target_col] == 0:
-            if target_col < self._width - 1:
-                for col in range(target_col + 1, self._width):
-                    if self._grid[target_row][col] != ((target_row + 1) * self._width) - (self._width - col):
-                        return False
-            if target_row < self._height - 1:
-                for col2 in range(self._width):
-                    if self._grid[target_row + 1][col2] != ((target_row + 2) * self._width) - (self._width - col2):
-                        return False
-                    else:
-                        return True
-            else:
-                return True
-        else:
-            return False
-    
-    def final_0_pos(self, zero_pos, end_zero_pos):
+        if isinstance(moves, str):
+            assert not moves.translate(_DROP_MOVES), "invalid direction in " + repr(moves)
+            return SolutionReplay(self, _pack_moves(moves), len(moves), interval)
+        count = struct.unpack_from("<I", moves, 0)[0]
+        return SolutionReplay(self, memoryview(moves)[4:], count, interval)
+
+    def _check_budget(self, phase, iterations, moves, scale=1):
         """
-        Returns move to place 0 in final position to satisfy invariants
+        Stop a solver loop after iterations passes that emitted moves
+        moves, once it has run past its budget: scale times
+        _ITERATION_BUDGET iterations or _MOVE_BUDGET moves per unit of
+        height + width
         """
-        print end_zero_pos
-        
-        v_dist = abs(zero_pos[0] - end_zero_pos[0])
-        h_dist = abs(zero_pos[1] - end_zero_pos[1])
-        move = ""
-        total_moves = ""
-        done = False
-        while not done:
-            if zero_pos[0] > end_zero_pos[0]:
-                for dummy_move in range(v_dist):
-                    move += "u"
-                total_moves += move
-                self.update_puzzle(move)
-                move = ""
-                zero_pos = self.current_position(0, 0)
-            elif zero_pos[0] < end_zero_pos[0]:
-                for dummy_move in range(end_zero_pos[0] - zero_pos[0]):
-                    move += "d"
-                total_moves += move
-                self.update_puzzle(move)
-                move = ""
-                zero_pos = self.current_position(0, 0)
-            elif zero_pos[1] != end_zero_pos[1]:
-                if zero_pos[1] > end_zero_pos[1]:
-                    for dummy_move in range(h_dist):
-                        move += "l"
-                    total_moves += move
-                    self.update_puzzle(move)
-                    move = ""
-                    zero_pos = self.current_position(0, 0)
-                elif zero_pos[1] < end_zero_pos[1]:
-                    for dummy_move in range(h_dist):
-                        move += "r"
-                    total_moves += move
-                    self.update_puzzle(move)
-                    move = ""
-                    zero_pos = self.current_position(0, 0)
-            
-            if zero_pos[0] == end_zero_pos[0]:
-                if zero_pos[1] == end_zero_pos[1]:
-                    done = True
-            
-        return total_moves
-                    
-    def position_tile(self, target_row, target_col, end_loc = None, end_zero_pos = None):
+        span = scale * (self._height + self._width)
+        if iterations > _ITERATION_BUDGET * span or moves > _MOVE_BUDGET * span:
+            raise SolverBudgetError(phase + " gave up after " + str(iterations)
+                                    + " iterations and " + str(moves) + " moves")
+
+    def _apply_macro(self, phase, locked, center, tile, goal, ends, borrowed=()):
         """
-        Returns a sequence of moves to position target tile in targeted space
+        Look up and apply the shortest macro, within a window around
+        offset center, that takes the tile at offset tile (None to track
+        no tile) to offset goal and the blank to one of the offsets in
+        ends, keeping the locked cells (see _is_locked) still except for
+        the borrowed ones, whose tiles end back home. The window grows
+        by a cell when the smaller one holds no such macro
+        Updates the puzzle and returns a move string
+        """
+        width = self._width
+        blank = self._tile_pos[0]
+        center_row, center_col = divmod(center, width)
+        lock_from, lock_col, held = locked
+        for radius in (_MACRO_RADIUS, _MACRO_RADIUS + 1):
+            top = max(center_row - radius, 0)
+            left = max(center_col - radius, 0)
+            bottom = min(center_row + radius, self._height - 1)
+            right = min(center_col + radius, width - 1)
+            window_width = right - left + 1
+
+            def local(offset):
+                """
+                Window offset of a board offset, or None outside the window
+                """
+                row, col = divmod(offset, width)
+                if top <= row <= bottom and left <= col <= right:
+                    return (row - top) * window_width + col - left
+                return None
+
+            # one bit per window cell; a row is free up to the first
+            # column locked by lock_from or, in the top two rows, lock_col
+            free = 0
+            for row in range(top, bottom + 1):
+                limit = lock_from - row * width
+                if row < 2:
+                    limit = min(limit, lock_col + 1)
+                count = max(0, min(limit - left, window_width))
+                free |= ((1 << count) - 1) << ((row - top) * window_width)
+            for cell in held:
+                if local(cell) != None:
+                    free &= ~(1 << local(cell))
+            for cell in borrowed:
+                free |= 1 << local(cell)
+            table = _macro_table(bottom - top + 1, window_width, free,
+                                 None if tile == None else local(goal),
+                                 tuple(local(end) for end in ends),
+                                 tuple(local(cell) for cell in borrowed))
+            moves = table.get((None if tile == None else local(tile), local(blank)))
+            if moves != None:
+                self.update_puzzle_from(divmod(blank, width), moves)
+                return moves
+        raise SolverBudgetError(phase + " found no macro for the blank at "
+                                + str(divmod(blank, width)) + " around "
+                                + str(divmod(center, width)))
+
+    def _is_locked(self, offset, locked):
+        """
+        Whether a phase with locked = (lock_from, lock_col, held) must
+        keep the tile at offset still: offsets from lock_from on, the
+        top two rows right of lock_col, and the offsets in held
+        Returns a boolean
         """
-        def is_zero_below(zero_pos, location):
+        lock_from, lock_col, held = locked
+        return (offset >= lock_from or offset in held
+                or (offset < 2 * self._width and offset % self._width > lock_col))
+
+    def _place_tile(self, phase, goal, end, lock_from, lock_col, borrowed=()):
+        """
+        Bring the tile that belongs at offset goal home and the blank to
+        offset end, keeping still the offsets from lock_from on and the
+        top two rows right of lock_col. Once the tile and the blank are
+        within _MACRO_RADIUS - 1 rows and columns of the goal this is
+        one macro, which may borrow the borrowed cells; before that the
+        blank is walked over to the tile, with the tile's cell held
+        still, and the tile then walked towards its goal, a diagonal or
+        straight step per macro
+        Updates the puzzle and returns a move string
+        """
+        width = self._width
+        hold = (lock_from, lock_col, tuple(borrowed))
+        goal_row, goal_col = divmod(goal, width)
+        reach = _MACRO_RADIUS - 1
+        total_moves = _MoveBuffer()
+
+        def is_free(row, col):
             """
-            Checks whether zero in position below target tile. Returns a boolean.
+            Whether (row, col) is on the board and not held still
             """
-            if zero_pos[1] == location[1]:
-                return True
+            return (0 <= row < self._height and 0 <= col < width
+                    and not self._is_locked(row * width + col, hold))
+
+        iterations = 0
+        while self._tile_pos[goal] != goal or self._tile_pos[0] != end:
+            iterations += 1
+            self._check_budget(phase, iterations, total_moves.count)
+            tile = self._tile_pos[goal]
+            tile_row, tile_col = divmod(tile, width)
+            blank_row, blank_col = divmod(self._tile_pos[0], width)
+
+            if max(abs(tile_row - goal_row), abs(tile_col - goal_col),
+                   abs(blank_row - goal_row), abs(blank_col - goal_col)) <= reach:
+                total_moves.add(self._apply_macro(phase, hold, goal, tile, goal,
+                                                  (end,), borrowed))
+            elif abs(tile_row - blank_row) <= reach and abs(tile_col - blank_col) <= reach:
+                run = self._run_tile(phase, hold, tile, goal, is_free)
+                if run:
+                    total_moves.add(run)
+                    continue
+                # step the tile towards its goal, the blank ending anywhere
+                # next to it
+                step_row = _toward(tile_row, goal_row)
+                step_col = _toward(tile_col, goal_col)
+                for row, col in ((tile_row + step_row, tile_col + step_col),
+                                 (tile_row, tile_col + step_col),
+                                 (tile_row + step_row, tile_col)):
+                    if (row, col) != (tile_row, tile_col) and is_free(row, col):
+                        break
+                ends = tuple(next_row * width + next_col for next_row, next_col
+                             in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+                             if is_free(next_row, next_col))
+                total_moves.add(self._apply_macro(phase, hold, row * width + col, tile,
+                                                  row * width + col, ends))
             else:
-                return False
-        
-        def update(self, move):
-            """
-            Updates puzzle with given move.
-            """
-            self.update_puzzle(move)
-            return move
-        
-        if end_loc == None:
-            end_loc = (target_row, target_col)
-        if end_zero_pos == None:
-            end_zero_pos = [target_row, target_col - 1]
-            
-        move = ""
-        total_moves = ""
-        location = self.current_position(target_row, target_col)
-        zero_pos = self.current_position(0, 0)
-        
-        while location != end_loc:
-            location = self.current_position(target_row, target_col)
-            zero_pos = self.current_position(0, 0)
-            
-            # x in correct col
-            if location[1] == end_loc[1] and location[0] != end_loc[0]:
-                v_dist = abs(zero_pos[0] - location[0])
-                for dummy_move in range(v_dist):
-                    move += "u"
-                total_moves += update(self, move)
-                move = ""
-                location = self.current_position(target_row, target_col)
-                zero_pos = self.current_position(0, 0)
-                
-                if is_zero_below(zero_pos, location):
-                    move += "ld"
-                total_moves += update(self, move)
-                move = ""
-                location = self.current_position(target_row, target_col)
-                zero_pos = self.current_position(0, 0)
-                    
-                # reposition 0 under x
-                if location[0] != end_loc[0]:
-                    if location[0] > end_loc[0]:
-                        if zero_pos[0] == location[0]:
-                            if zero_pos[1] == location[1] - 1:
-                                move += "urd"
-                            elif zero_pos[1] == location[1] + 1:
-                                move += "uld"
-                    elif location[0] < end_loc[0]:
-                        if zero_pos[1] > location[1]:
-                            if zero_pos[0] != 0:
-                                move += "ullddr"
-                            else:
-                                move += "dl"
-                        else:
-                            move += "dr"
-                    total_moves += update(self, move)
-                    move = ""
-                    location = self.current_position(target_row, target_col)
-                    zero_pos = self.current_position(0, 0)
-                        
-            # if x not in correct col    
-            elif location[1] != end_loc[1]:
-                if location[0] < zero_pos[0]:
-                    v_dist = abs(zero_pos[0] - location[0])
-                    for dummy_move in range(v_dist):
-                        move += "u"
-                    total_moves += update(self, move)
-                    move = ""
-                    location = self.current_position(target_row, target_col)
-                    zero_pos = self.current_position(0, 0)
-                
-                if location[1] > zero_pos[1] and location[1] > end_loc[1]:
-                    for dummy_move in range(abs(location[1] - zero_pos[1])):
-                        move += "r"
-                elif location[1] < zero_pos[1] and location[1] < end_loc[1]:
-                    for dummy_move in range(abs(location[1] - zero_pos[1])):
-                        move += "l"
-                total_moves += update(self, move)
-                move = ""
-                location = self.current_position(target_row, target_col)
-                zero_pos = self.current_position(0, 0)
-                
-                # if col is wrong
-                if location[1] < zero_pos[1] and location[1] != end_loc[1]:
-                    move += "ul"
-                    if location[1] != end_loc[1]:
-                        move += "ld"
-                elif location[1] > zero_pos[1] and location[1] != end_loc[1]:
-                    move += "ur"
-                    if location[1] != end_loc[1]:
-                        move += "rd"
-                
-                # if top row
-                if location[0] == 0:
-                    move = move.replace("d", "u")
-                    move = move.replace("u", "d", 1)
-                total_moves += update(self, move)
-                move = ""
-                location = self.current_position(target_row, target_col)
-                zero_pos = self.current_position(0, 0)
-                    
-                if location[0] > zero_pos[0]:
-                    move += "ld"
-                    if location[1] == 0:
-                        move = move.replace("l", "r")
-
-            total_moves += update(self, move)
-            move = ""
-            location = self.current_position(target_row, target_col)
-            zero_pos = self.current_position(0, 0)
-        
-        # getting 0 into final position to satisfy invariants   
-        if location == (end_loc) and zero_pos != end_zero_pos:
-            total_moves += self.final_0_pos(zero_pos, end_zero_pos) 
-        
-        return total_moves
-        
-        
+                # walk the blank up to reach rows and columns towards the tile
+                step_row = max(-reach, min(reach, tile_row - blank_row))
+                step_col = max(-reach, min(reach, tile_col - blank_col))
+                for row, col in ((blank_row + step_row, blank_col + step_col),
+                                 (blank_row + step_row, blank_col),
+                                 (blank_row, blank_col + step_col)):
+                    if (row, col) != (tile_row, tile_col) and is_free(row, col):
+                        break
+                total_moves.add(self._apply_macro(phase, (lock_from, lock_col, tuple(borrowed) + (tile,)),
+                                                  row * width + col, None, None,
+                                                  (row * width + col,)))
+        return total_moves.join()
+
+    def _run_tile(self, phase, locked, tile, goal, is_free):
+        """
+        Move a tile that is far from its goal along a line: one macro
+        puts the blank next to it, then every step is the same short
+        cycle, so a long run costs one table lookup. The tile runs
+        diagonally (six moves a step) while both its row and column are
+        far off, then straight (five moves a step round a free side
+        lane), and stops _MACRO_RADIUS cells short of the goal;
+        is_free(row, col) tells the cells the run may use
+        Updates the puzzle and returns a move string, empty when the
+        tile is close to its goal or has no clear line
+        """
+        width = self._width
+        tile_row, tile_col = divmod(tile, width)
+        goal_row, goal_col = divmod(goal, width)
+        step_row = _toward(tile_row, goal_row)
+        step_col = _toward(tile_col, goal_col)
+        down = {1: "d", -1: "u"}.get(step_row)
+        across = {1: "r", -1: "l"}.get(step_col)
+
+        steps = min(abs(goal_row - tile_row), abs(goal_col - tile_col)) - _MACRO_RADIUS
+        if steps > 0:
+            # with the blank beside the tile, towards the goal column
+            if not all(is_free(tile_row + step_row * (dist + drop), tile_col + step_col * (dist + side))
+                       for dist in range(steps + 1) for drop in (0, 1) for side in (0, 1, 2)):
+                return ""
+            moves = self._apply_macro(phase, locked, tile, tile, tile, (tile + step_col,))
+            run = (_INVERSE_MOVE[across] + down + across + _INVERSE_MOVE[down]
+                   + across + down) * steps
+        else:
+            if abs(goal_col - tile_col) > _MACRO_RADIUS:
+                steps = abs(goal_col - tile_col) - _MACRO_RADIUS
+                step_row, ahead = 0, across
+                sides = ((-1, 0, "u", "d"), (1, 0, "d", "u"))
+            elif abs(goal_row - tile_row) > _MACRO_RADIUS:
+                steps = abs(goal_row - tile_row) - _MACRO_RADIUS
+                step_col, ahead = 0, down
+                sides = ((0, -1, "l", "r"), (0, 1, "r", "l"))
+            else:
+                return ""
+
+            # the tile's line and one side lane must be free for the whole run
+            for side_row, side_col, out, back in sides:
+                if all(is_free(tile_row + step_row * dist, tile_col + step_col * dist)
+                       and is_free(tile_row + step_row * dist + side_row,
+                                   tile_col + step_col * dist + side_col)
+                       for dist in range(1, steps + 2)):
+                    break
+            else:
+                return ""
+            # one step with the blank ending just ahead of the tile, then
+            # cycles that each push the tile on and bring the blank round
+            first = tile + step_row * width + step_col
+            moves = self._apply_macro(phase, locked, first, tile, first,
+                                      (first + step_row * width + step_col,))
+            run = (_INVERSE_MOVE[ahead] + out + ahead + ahead + back) * (steps - 1)
+
+        self.update_puzzle_from(divmod(self._tile_pos[0], width), run)
+        return moves + run
+
+    ##################################################################
+    # Phase one methods
+
+    def lower_row_invariant(self, target_row, target_col):
+        """
+        Check whether the puzzle satisfies the specified invariant
+        at the given position in the bottom rows of the puzzle (target_row > 1)
+        Returns a boolean
+        """
+        zero = target_col + self._width * target_row
+        return self._cells[zero] == 0 and self._solved_from <= zero + 1
+
     def solve_interior_tile(self, target_row, target_col):
         """
         Place correct tile at target position
@@ -332,11 +1421,13 @@ class Puzzle:
         """
         assert target_row > 1
         assert target_col > 0
-        assert self.lower_row_invariant(target_row, target_col)
+        self._check_invariant(self.lower_row_invariant, target_row, target_col)
 
-        move_sequence = self.position_tile(target_row, target_col)
+        goal = target_col + self._width * target_row
+        move_sequence = self._place_tile("solve_interior_tile", goal, goal - 1,
+                                         goal + 1, self._width - 1)
 
-        assert self.lower_row_invariant(target_row, target_col -1)
+        self._check_invariant(self.lower_row_invariant, target_row, target_col - 1)
         return move_sequence
 
 
@@ -345,41 +1436,20 @@ class Puzzle:
         Solve tile in column zero on specified row (> 1)
         Updates puzzle and returns a move string
         """
-        assert self.lower_row_invariant(target_row, 0)
-        
-        location = self.current_position(target_row, 0)
-        zero_pos = [target_row, 0]
-        total_moves = ""
-        move = ""
-        
-        while location != (target_row, 0):
-            skip = False
-            location = self.current_position(target_row, 0)
-            if location == (target_row - 1, 0):
-                move = "u"
-                zero_pos[0] -= 1
-                skip = True
-            elif location == (target_row - 1, 1):
-                move = "urulddrulurddlur"
-                zero_pos = [target_row - 1, 1]
-                skip = True
-            if zero_pos[1] != self._width - 1 and location == (target_row, 0):
-                dist = (self._width - 1) - zero_pos[1]
-                for dummy_move in range(dist):
-                    move += "r"
-                zero_pos[1] = self._width - 1
-                skip = True
-                            
-            if not skip:
-                if location != (target_row - 1, 1) and location != (target_row, 0):
-                    total_moves += self.position_tile(target_row, 0, (target_row - 1, 1), (target_row, 0))
-                        
-            total_moves += move
-            self.update_puzzle(move)
-            move = ""
+        self._check_invariant(self.lower_row_invariant, target_row, 0)
         
-        assert self.lower_row_invariant(target_row - 1, self._width - 1)
-        return total_moves
+        # the tile can only come home from above by moving (target_row, 1)
+        # aside and back, so the macro borrows that cell
+        goal = self._width * target_row
+        total_moves = _MoveBuffer()
+        total_moves.add(self._place_tile("solve_col0_tile", goal, goal - self._width + 1,
+                                         goal + 1, self._width - 1, (goal + 1,)))
+        move = "r" * (self._width - 2)
+        self.update_puzzle_from((target_row - 1, 1), move)
+        total_moves.add(move)
+
+        self._check_invariant(self.lower_row_invariant, target_row - 1, self._width - 1)
+        return total_moves.join()
                     
 
     #############################################################
@@ -391,30 +1461,10 @@ class Puzzle:
         at the given column (col > 1)
         Returns a boolean
         """
-        if self._grid[0][target_col] != 0:
-            return False
-        
-        portion = 1
-        for idx in range(2):
-            right = self._grid[idx]
-            col = len(right[target_col + portion:])
-            for val in right[target_col + portion:]:
-                tile = self._width + (idx * self._width) - col
-                if val != tile:
-                    return False
-                col -= 1
-            portion -= 1
-        
-        for idx in range(2, self._height):
-            row = self._grid[idx]
-            col = self._width
-            for val in row:
-                tile = self._width + (idx * self._width) - col
-                if val != tile:
-                    return False
-                col -= 1
-                
-        return True
+        below = self._width + target_col
+        return (self._cells[target_col] == 0 and self._cells[below] == below
+                and self._top_solved_from <= target_col + 1
+                and self._solved_from <= 2 * self._width)
 
     def row1_invariant(self, target_col):
         """
@@ -422,98 +1472,37 @@ class Puzzle:
         at the given column (col > 1)
         Returns a boolean
         """
-        if self._grid[1][target_col] != 0:
-            return False
-        
-        for idx in range(2):
-            right = self._grid[idx]     
-            col = len(right[target_col + 1:])
-            for val in right[target_col + 1:]:
-                tile = self._width + (idx * self._width) - col
-                if val != tile:
-                    return False
-                col -= 1
-                
-        for idx in range(2, self._height):
-            row = self._grid[idx]
-            col = self._width
-            for val in row:
-                tile = self._width + (idx * self._width) - col
-                if val != tile:
-                    return False
-                col -= 1
-                
-        return True
+        return (self._cells[self._width + target_col] == 0
+                and self._top_solved_from <= target_col + 1
+                and self._solved_from <= 2 * self._width)
 
     def solve_row0_tile(self, target_col):
         """
         Solve the tile in row zero at the specified column
         Updates puzzle and returns a move string
         """
-        assert self.row0_invariant(target_col)
-        
-        location = self.current_position(0, target_col)
-        zero_pos = self.current_position(0, 0)
-        total_moves = ""
-        move = ""
+        self._check_invariant(self.row0_invariant, target_col)
         
-        while location != (0, target_col):
-            if location[0] == 0 and location[1] == target_col - 1 and self.row0_invariant(target_col):
-                move += "ld"
-                self.update_puzzle(move)
-                total_moves += move
-                move = ""
-                location = self.current_position(0, target_col)
-                zero_pos = self.current_position(0, 0)
-                break
-          
-            if location[0] > zero_pos[0] and location[1] < zero_pos[1]:
-                for dummy_move in range(zero_pos[1] - location[1]):
-                    move += "l"
-                for dummy_move in range(abs(zero_pos[0] - location[0])):
-                    move += "d"
-                total_moves += move
-                self.update_puzzle(move)
-                move = ""
-                location = self.current_position(0, target_col)
-                zero_pos = self.current_position(0, 0)
-            
-                if location[1] != target_col - 1:
-                    move += "ruldr"
-                    total_moves += move
-                    self.update_puzzle(move)
-                    move = ""
-                    location = self.current_position(0, target_col)
-                    zero_pos = self.current_position(0, 0)
-              
-            if location[0] == 0 and location[1] == target_col - 1:
-                move += "uldrurdluldruldrruld"
-                self.update_puzzle(move)
-                total_moves += move
-                move = ""
-                location = self.current_position(0, target_col)
-                zero_pos = self.current_position(0, 0)
-            
-            else:
-                move_sequence = self.position_tile(0, target_col, (0, target_col - 1), (1, target_col - 1))
-                total_moves += move_sequence
-                move = ""
-                location = self.current_position(0, target_col)
-                zero_pos = self.current_position(0, 0)
-               
-        assert self.row1_invariant(target_col - 1)
-        return total_moves
+        # (1, target_col) is solved already, so the macro borrows it
+        width = self._width
+        move_sequence = self._place_tile("solve_row0_tile", target_col, width + target_col - 1,
+                                         2 * width, target_col, (width + target_col,))
+
+        self._check_invariant(self.row1_invariant, target_col - 1)
+        return move_sequence
 
     def solve_row1_tile(self, target_col):
         """
         Solve the tile in row one at the specified column
         Updates puzzle and returns a move string
         """
-        assert self.row1_invariant(target_col)
+        self._check_invariant(self.row1_invariant, target_col)
         
-        move_sequence = self.position_tile(1, target_col, None, (0, target_col))
-        
-        assert self.row0_invariant(target_col)
+        width = self._width
+        move_sequence = self._place_tile("solve_row1_tile", width + target_col, target_col,
+                                         2 * width, target_col)
+
+        self._check_invariant(self.row0_invariant, target_col)
         
         return move_sequence
 
@@ -525,103 +1514,1439 @@ class Puzzle:
         Solve the upper left 2x2 part of the puzzle
         Updates the puzzle and returns a move string
         """
-        assert self.row1_invariant(1)
-        
-        total_moves = ""
-        sequence = ["l", "u", "r", "d"]
-        
-        row0 = [val for val in range(self._width)]
-        row1 = [val + self._width for val in range(self._width)]
+        self._check_invariant(self.row1_invariant, 1)
         
-        while self._grid[0] != row0 and self._grid[1] != row1:
-            for move in sequence:
-                total_moves += move
-                self.update_puzzle(move)
-                if self._grid[0] == row0 and self._grid[1] == row1:
-                    break
-                    
+        total_moves = self._corner_solution()
+        self.update_puzzle(total_moves)
         return total_moves
 
-    def solve_puzzle(self):
+    def _corner_solution(self):
+        """
+        Look the upper left 2x2 corner up in _SOLUTIONS_2X2, wherever the
+        blank is in it
+        Returns a move string
+        """
+        corner = (0, 1, self._width, self._width + 1)
+        key = tuple(corner.index(self._cells[offset]) if self._cells[offset] in corner else -1
+                    for offset in corner)
+        if key not in _SOLUTIONS_2X2:
+            raise SolverBudgetError("solve_2x2 found an unsolvable corner " + str(key))
+        return _SOLUTIONS_2X2[key]
+
+    def _board_key(self, optimize):
+        """
+        Compact SolutionCache key for the whole board
+        Returns a bytes object
+        """
+        return struct.pack("<HH?", self._height, self._width, optimize) + self._cells.tobytes()
+
+    def _endgame_key(self, target_col):
+        """
+        SolutionCache key for the two-row endgame with the blank at
+        (1, target_col): only columns up to target_col of the top two
+        rows are still unsolved
+        Returns a bytes object
+        """
+        width = self._width
+        return (struct.pack("<HHH", self._height, width, target_col)
+                + self._cells[:target_col + 1].tobytes()
+                + self._cells[width:width + target_col + 1].tobytes())
+
+    def solve_puzzle(self, optimize=False, cache=None, shortest_below=None):
         """
-        Generate a solution string for a puzzle
+        Generate a solution string for a puzzle; with optimize, the
+        solution is shortened by optimize_moves and checked to still
+        reach the solved board. With a SolutionCache, boards and two-row
+        endgames solved before are looked up instead of solved again.
+        Boards with fewer than shortest_below reachable states are
+        solved exactly by solve_bidirectional instead
         Updates the puzzle and returns a move string
         """
-        def solved(self, solved_puzzle):
-            """
-            Checks the current grid with the solved grid; returns True when puzzle is solved
-             """
-            if self._grid == solved_puzzle:
-                return True
-            else:
-                return False
-            
-        solved_puzzle = [[col + (self._width * row) for col in range(self._width)] for row in range(self._height)]
-        total_moves = ""
+        assert self.is_solvable(), "puzzle is not solvable"
+        if shortest_below != None \
+           and math.factorial(self._height * self._width) // 2 < shortest_below:
+            return self.solve_bidirectional(shortest_below)
+        if cache != None:
+            board_key = self._board_key(optimize)
+            cached = cache.get_board(board_key)
+            if cached != None:
+                self.update_puzzle(cached)
+                return cached
+        if optimize:
+            start = self.clone()
+
+        solution = "".join(self._solution_chunks(cache))
+        if optimize:
+            solution = optimize_moves(solution)
+            start.update_puzzle(solution)
+            assert start._cells == self._cells, "optimized moves reach a different board"
+        if cache != None:
+            cache.put_board(board_key, solution)
+        return solution
+
+    def iter_solution(self, cache=None):
+        """
+        Generate the solve_puzzle solution one phase call at a time
+        (blank positioning, then solve_interior_tile and solve_col0_tile
+        row by row, solve_row1_tile and solve_row0_tile column by column,
+        and solve_2x2), so consumers can replay moves while the solve
+        goes on. The puzzle is updated before each chunk is yielded.
+        Moves are not kept, so this is the path for large boards: memory
+        stays at the board plus the memoized macro tables
+        Returns an iterator of move strings
+        """
+        assert self.is_solvable(), "puzzle is not solvable"
+        return (chunk for chunk in self._solution_chunks(cache) if chunk)
+
+    def _solution_chunks(self, cache=None):
+        """
+        The phased solver behind solve_puzzle and iter_solution; moves
+        are only kept when a cache needs the endgame solutions
+        Updates the puzzle and yields move strings
+        """
+        total_moves = _MoveBuffer(keep=cache != None)
         move = ""
         zero_pos = self.current_position(0, 0)
+
+        if self._height == 1 or self._width == 1:
+            # tiles in a single line never pass each other, so a solvable
+            # board is solved by walking the blank back to (0, 0)
+            move = "u" * zero_pos[0] + "l" * zero_pos[1]
+            if move:
+                total_moves.add(move)
+                self.update_puzzle_from(zero_pos, move)
+                yield move
+            return
+
+        if 0 < self._solved_from <= self._width + 2 and self._top_solved_from <= 2:
+            # only the upper left 2x2 corner is out of place; its table
+            # covers every arrangement, not just those with the blank at (1, 1)
+            move = self._corner_solution()
+            total_moves.add(move)
+            self.update_puzzle_from(zero_pos, move)
+            yield move
+            return
         
-        if not solved(self, solved_puzzle):
+        if self._solved_from != 0:
             not_solved = None
+            width = self._width
             for row in range(self._height - 1, -1, -1):
-                if self._grid[row] != solved_puzzle[row]:
+                if self._row(row).tolist() != list(range(row * width, (row + 1) * width)):
                     not_solved = row
                     break
                 
             idx = ()  
-            for col in range(self._width):
-                if (not_solved, col) != self.current_position(not_solved, col):
-                    idx = (not_solved, col)
+            if not_solved <= 1:
+                # the top two rows are solved column by column from the
+                # right, so start at the last column where either is not
+                idx = (1, self._top_solved_from - 1)
+            else:
+                for col in range(self._width):
+                    if (not_solved, col) != self.current_position(not_solved, col):
+                        idx = (not_solved, col)
           
+            iterations = 0
             while zero_pos != idx:
+                iterations += 1
+                self._check_budget("solve_puzzle", iterations, total_moves.count)
                 if zero_pos[1] > idx[1] or zero_pos[1] < idx[1]:
-                    for dummy_move in range(abs(zero_pos[1] - idx[1])):
-                        if zero_pos[1] > idx[1]:
-                            move += "l"
-                        else:
-                            move += "r"
-                    total_moves += move
-                    self.update_puzzle(move)
+                    if zero_pos[1] > idx[1]:
+                        move += "l" * (zero_pos[1] - idx[1])
+                    else:
+                        move += "r" * (idx[1] - zero_pos[1])
+                    total_moves.add(move)
+                    zero_pos = self.update_puzzle_from(zero_pos, move)
+                    yield move
                     move = ""
-                    zero_pos = self.current_position(0, 0)
                 if zero_pos[0] < idx[0] or zero_pos[0] > idx[0]:
-                    for dummy_move in range(abs(zero_pos[0] - idx[0])):
-                        if zero_pos[0] < idx[0]:
-                            move += "d"
-                        else:
-                            move += "u"
-                    total_moves += move
-                    self.update_puzzle(move)
+                    if zero_pos[0] < idx[0]:
+                        move += "d" * (idx[0] - zero_pos[0])
+                    else:
+                        move += "u" * (zero_pos[0] - idx[0])
+                    total_moves.add(move)
+                    zero_pos = self.update_puzzle_from(zero_pos, move)
+                    yield move
                     move = ""
-                    zero_pos = self.current_position(0, 0)
                 
             if zero_pos[0] == 1:
                 if not self.row1_invariant(zero_pos[1]):
                     move += "ur"
-                    total_moves += move
-                    self.update_puzzle(move)
+                    total_moves.add(move)
+                    zero_pos = self.update_puzzle_from(zero_pos, move)
+                    yield move
                     move = ""
-                    zero_pos = self.current_position(0, 0)
           
-            while not solved(self, solved_puzzle):
+            # (key, moves so far) of each endgame passed, to cache what
+            # finished it once the board is solved
+            endgames = []
+            iterations = 0
+            while self._solved_from != 0:
+                iterations += 1
+                self._check_budget("solve_puzzle", iterations, total_moves.count,
+                                   self._height * self._width)
+                moves_before = total_moves.count
+                if cache != None and zero_pos[0] == 1 and zero_pos[1] > 0 \
+                   and self.row1_invariant(zero_pos[1]):
+                    endgame_key = self._endgame_key(zero_pos[1])
+                    finish = cache.get_endgame(endgame_key)
+                    if finish != None:
+                        total_moves.add(finish)
+                        zero_pos = self.update_puzzle_from(zero_pos, finish)
+                        yield finish
+                        break
+                    endgames.append((endgame_key, moves_before))
                 if zero_pos[0] > 1 and zero_pos[1] != 0:
-                    total_moves += self.solve_interior_tile(zero_pos[0], zero_pos[1])
+                    move = self.solve_interior_tile(zero_pos[0], zero_pos[1])
+                    total_moves.add(move)
+                    yield move
                 zero_pos = self.current_position(0, 0)
                 if zero_pos[0] > 1 and zero_pos[1] == 0:
-                    total_moves += self.solve_col0_tile(zero_pos[0])
+                    move = self.solve_col0_tile(zero_pos[0])
+                    total_moves.add(move)
+                    yield move
                 zero_pos = self.current_position(0, 0)
                 if zero_pos[0] == 1 and zero_pos[1] > 1:
-                    total_moves += self.solve_row1_tile(zero_pos[1])
+                    move = self.solve_row1_tile(zero_pos[1])
+                    total_moves.add(move)
+                    yield move
                 zero_pos = self.current_position(0, 0)
                 if zero_pos[0] == 0 and zero_pos[1] > 1:
-                    total_moves += self.solve_row0_tile(zero_pos[1])
+                    move = self.solve_row0_tile(zero_pos[1])
+                    total_moves.add(move)
+                    yield move
                 zero_pos = self.current_position(0, 0)
                 if zero_pos == (1, 1):
-                    total_moves += self.solve_2x2()
+                    move = self.solve_2x2()
+                    total_moves.add(move)
+                    yield move
                 zero_pos = self.current_position(0, 0)
+                if total_moves.count == moves_before and self._solved_from != 0:
+                    # no phase applies to where the blank ended up
+                    raise SolverBudgetError("solve_puzzle is stuck with the blank at "
+                                            + str(zero_pos))
+
+            if cache != None:
+                all_moves = total_moves.join()
+                for endgame_key, moves_before in endgames:
+                    cache.put_endgame(endgame_key, all_moves[moves_before:])
+
+    ###########################################################
+    # Optimal solver
+
+    def solve_optimal(self, pattern_db=None):
+        """
+        Generate a shortest solution string for a puzzle with IDA*.
+        The estimate is Manhattan distance plus linear conflicts, or the
+        given PatternDatabase for this board size when there is one.
+        Updates the puzzle and returns a move string
+        """
+        assert self.is_solvable(), "puzzle is not solvable"
+
+        height = self._height
+        width = self._width
+        zero_row, zero_col = self.current_position(0, 0)
+        cells = self._cells.tolist()
+        neighbours = _neighbour_table(height, width)
+        if pattern_db == None:
+            estimator = _ConflictEstimate(cells, height, width)
+        else:
+            assert pattern_db.get_size() == (height, width), "pattern database size mismatch"
+            estimator = _PatternEstimate(cells, pattern_db)
+        path = []
+        search = _bounded_search(cells, neighbours, estimator, path)
+
+        estimate = estimator.initial
+        bound = estimate
+        while True:
+            result = search(zero_col + width * zero_row, 0, bound, estimate, None)
+            if result == -1:
+                break
+            assert result != None, "no solution found"
+            bound = result
+
+        move_string = "".join(path)
+        self.update_puzzle_from((zero_row, zero_col), move_string)
+        return move_string
+
+    def solve_parallel(self, workers=None, pattern_db_path=None, frontier_size=None):
+        """
+        Generate a shortest solution string with IDA* spread over a pool
+        of worker processes (one per core by default). The first plies
+        from the board, without moves that undo the one before, are
+        expanded breadth first until the frontier holds frontier_size
+        boards (16 per worker by default); each threshold iteration then
+        searches every frontier board's subtree in a worker, and a
+        shared flag stops the others once one of them solves the board.
+        The estimate is as in solve_optimal, with the pattern database
+        file at pattern_db_path if given
+        Updates the puzzle and returns a move string
+        """
+        assert self.is_solvable(), "puzzle is not solvable"
+        if workers == None:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        if frontier_size == None:
+            frontier_size = 16 * workers
+
+        height = self._height
+        width = self._width
+        zero_row, zero_col = self.current_position(0, 0)
+        neighbours = _neighbour_table(height, width)
+        goal = list(range(height * width))
+
+        # layers of (cells, blank, previous, path) nodes; a shallow
+        # solution turns up here, so the subtrees only hold longer ones
+        frontier = [(self._cells.tolist(), zero_col + width * zero_row, None, "")]
+        solution = None
+        while True:
+            for cells, dummy_blank, dummy_previous, path in frontier:
+                if cells == goal:
+                    solution = path
+                    break
+            if solution != None or len(frontier) >= frontier_size:
+                break
+            next_frontier = []
+            for cells, blank, previous, path in frontier:
+                for direction, target in neighbours[blank]:
+                    if direction == previous:
+                        continue
+                    child = list(cells)
+                    child[blank] = child[target]
+                    child[target] = 0
+                    next_frontier.append((child, target, _INVERSE_MOVE[direction],
+                                          path + direction))
+            frontier = next_frontier
+
+        if solution == None:
+            solution = _run_subtrees(frontier, height, width, workers, pattern_db_path)
+        self.update_puzzle_from((zero_row, zero_col), solution)
+        return solution
+
+    def solve_bidirectional(self, max_states=_BIDIRECTIONAL_STATES):
+        """
+        Generate a shortest solution string with a breadth-first search
+        from both the board and the solved board, each layer grown on
+        the side with the smaller frontier. States are boards packed by
+        _pack_board. Only for boards whose (height * width)!
+        / 2 reachable states are at most max_states
+        Updates the puzzle and returns a move string
+        """
+        assert self.is_solvable(), "puzzle is not solvable"
+        height = self._height
+        width = self._width
+        size = height * width
+        if math.factorial(size) // 2 > max_states:
+            raise SolverBudgetError("solve_bidirectional is limited to " + str(max_states)
+                                    + " states, a " + str(height) + "x" + str(width)
+                                    + " board has " + str(math.factorial(size) // 2))
+
+        bits = (size - 1).bit_length()
+        mask = (1 << bits) - 1
+        neighbours = _neighbour_table(height, width)
+        start_blank = self._tile_pos[0]
+        start = _pack_board(self._cells)
+        goal = _pack_board(range(size))
+
+        def expand(frontier, seen, other):
+            """
+            Grow one side by a layer; seen maps each state reached to
+            the direction of the blank's last move (None for the root)
+            Returns the next frontier and the states also in other, as
+            lists of (state, blank offset) tuples
+            """
+            next_frontier = []
+            meetings = []
+            for state, blank in frontier:
+                for direction, target in neighbours[blank]:
+                    child = _slide(state, blank, target, bits, mask)
+                    if child in seen:
+                        continue
+                    seen[child] = direction
+                    next_frontier.append((child, target))
+                    if child in other:
+                        meetings.append((child, target))
+            return next_frontier, meetings
+
+        forward = {start: None}
+        backward = {goal: None}
+        forward_frontier = [(start, start_blank)]
+        backward_frontier = [(goal, 0)]
+        meetings = [(start, start_blank)] if start == goal else []
+        while not meetings:
+            assert forward_frontier and backward_frontier, "no solution found"
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meetings = expand(forward_frontier, forward, backward)
+            else:
+                backward_frontier, meetings = expand(backward_frontier, backward, forward)
+
+        # the layer may meet the other side at several depths
+        best = None
+        for state, blank in meetings:
+            moves = _walk_back(forward, state, blank, width, bits, mask)[::-1]
+            moves.extend(_INVERSE_MOVE[direction]
+                         for direction in _walk_back(backward, state, blank, width, bits, mask))
+            if best == None or len(moves) < len(best):
+                best = moves
+
+        move_string = "".join(best)
+        self.update_puzzle_from(divmod(start_blank, width), move_string)
+        return move_string
+
+    def solve_weighted(self, weight=2.0, beam_width=None, max_states=_WEIGHTED_STATES):
+        """
+        Generate a solution string with weighted A*, taking boards in
+        order of moves so far plus weight times their Manhattan
+        distance. That distance never overestimates and changes by one
+        per move, so the solution is at most weight times as long as a
+        shortest one (weight 1 is plain A*). With beam_width, each depth
+        keeps only its beam_width closest boards instead: faster, with
+        memory bounded by depth times beam_width, but no length
+        guarantee. Boards are packed by _pack_board;
+        keeping more than max_states raises SolverBudgetError
+        Updates the puzzle and returns a move string
+        """
+        assert self.is_solvable(), "puzzle is not solvable"
+        assert weight >= 1, "weight must be at least 1"
+        height = self._height
+        width = self._width
+        size = height * width
+        bits = (size - 1).bit_length()
+        mask = (1 << bits) - 1
+        neighbours = _neighbour_table(height, width)
+        manhattan = _manhattan_table(height, width)
+        start_blank = self._tile_pos[0]
+        start = _pack_board(self._cells)
+        goal = _pack_board(range(size))
+        estimate = 0
+        for offset in range(size):
+            estimate += manhattan[self._cells[offset] * size + offset]
+
+        # seen maps each kept board to its moves so far and the blank's
+        # last move (None for the start)
+        seen = {start: (0, None)}
+        if beam_width == None:
+            closed = set()
+            heap = [(weight * estimate, estimate, 0, start, start_blank)]
+            while heap:
+                dummy_cost, estimate, depth, state, blank = heapq.heappop(heap)
+                if state == goal:
+                    break
+                if state in closed or seen[state][0] != depth:
+                    # expanded already, or since reached in fewer moves
+                    continue
+                closed.add(state)
+                for direction, target in neighbours[blank]:
+                    child = _slide(state, blank, target, bits, mask)
+                    if child in closed or (child in seen and seen[child][0] <= depth + 1):
+                        continue
+                    seen[child] = (depth + 1, direction)
+                    tile = (state >> (bits * target)) & mask
+                    child_estimate = (estimate + manhattan[tile * size + blank]
+                                      - manhattan[tile * size + target])
+                    heapq.heappush(heap, (depth + 1 + weight * child_estimate,
+                                          child_estimate, depth + 1, child, target))
+                if len(seen) > max_states:
+                    raise SolverBudgetError("solve_weighted gave up after keeping "
+                                            + str(len(seen)) + " boards")
+        else:
+            layer = [(estimate, start, start_blank)]
+            depth = 0
+            while goal not in seen:
+                candidates = {}
+                for estimate, state, blank in layer:
+                    for direction, target in neighbours[blank]:
+                        child = _slide(state, blank, target, bits, mask)
+                        if child not in seen and child not in candidates:
+                            tile = (state >> (bits * target)) & mask
+                            candidates[child] = (estimate + manhattan[tile * size + blank]
+                                                 - manhattan[tile * size + target],
+                                                 target, direction)
+                if not candidates:
+                    raise SolverBudgetError("solve_weighted ran out of boards at depth "
+                                            + str(depth))
+                depth += 1
+                layer = heapq.nsmallest(beam_width, ((child_estimate, child, target)
+                                                     for child, (child_estimate, target,
+                                                                 dummy_direction)
+                                                     in candidates.items()))
+                for dummy_estimate, child, dummy_target in layer:
+                    seen[child] = (depth, candidates[child][2])
+                if len(seen) > max_states:
+                    raise SolverBudgetError("solve_weighted gave up after keeping "
+                                            + str(len(seen)) + " boards")
+
+        # walk back from the goal, whose blank is at offset 0
+        moves = _walk_back(seen, goal, 0, width, bits, mask, 1)
+        move_string = "".join(reversed(moves))
+        self.update_puzzle_from(divmod(start_blank, width), move_string)
+        return move_string
+
+    def solve_from_table(self, table):
+        """
+        Generate a shortest solution string by following the best moves
+        stored in a DistanceTable for this board size
+        Updates the puzzle and returns a move string
+        """
+        width = self._width
+        assert table.get_size() == (self._height, width), "distance table size mismatch"
+        step = _offset_steps(width)
+        cells = self._cells.tolist()
+        positions = self._tile_pos.tolist()
+        moves = []
+        entry = table.lookup(positions)
+        assert entry != None, "puzzle is not solvable"
+        while entry[1] != None:
+            blank = positions[0]
+            target = blank + step[entry[1]]
+            tile = cells[target]
+            cells[blank] = tile
+            cells[target] = 0
+            positions[tile] = blank
+            positions[0] = target
+            moves.append(entry[1])
+            entry = table.lookup(positions)
+
+        move_string = "".join(moves)
+        self.update_puzzle_from(divmod(self._tile_pos[0], width), move_string)
+        return move_string
+
+
+##################################################################
+# Profiling
+
+class SolverStats:
+    """
+    Counters filled in by puzzles with stats enabled: per method, the
+    number of calls, moves emitted and inclusive wall time in seconds
+    """
+
+    __slots__ = ("_counters",)
+
+    def __init__(self):
+        """
+        Start with no counters
+        """
+        self._counters = {}
+
+    def record(self, name, moves, seconds):
+        """
+        Count one call of method name
+        """
+        entry = self._counters.get(name)
+        if entry == None:
+            entry = self._counters[name] = [0, 0, 0.0]
+        entry[0] += 1
+        entry[1] += moves
+        entry[2] += seconds
+
+    def as_dict(self):
+        """
+        Export the counters
+        Returns a dictionary of {"calls", "moves", "seconds"} dictionaries
+        """
+        return dict((name, {"calls": calls, "moves": moves, "seconds": seconds})
+                    for name, (calls, moves, seconds) in self._counters.items())
+
+    def merge(self, counters):
+        """
+        Add counters exported by as_dict (from another process, say)
+        """
+        for name, entry in counters.items():
+            mine = self._counters.setdefault(name, [0, 0, 0.0])
+            mine[0] += entry["calls"]
+            mine[1] += entry["moves"]
+            mine[2] += entry["seconds"]
+
+    def reset(self):
+        """
+        Drop all counters
+        """
+        self._counters = {}
+
+
+# methods of _ProfiledPuzzle that report to SolverStats
+_PROFILED_METHODS = ("current_position", "update_puzzle", "update_puzzle_from",
+                     "lower_row_invariant", "row0_invariant", "row1_invariant",
+                     "solve_interior_tile", "solve_col0_tile", "solve_row1_tile",
+                     "solve_row0_tile", "solve_2x2", "solve_puzzle", "solve_optimal",
+                     "solve_parallel", "solve_bidirectional", "solve_weighted",
+                     "solve_from_table")
+
+
+def _profiled(name):
+    """
+    Wrap Puzzle method name to report to the puzzle's SolverStats; moves
+    are the length of the returned (or, for updates, the applied) string
+    Returns a function
+    """
+    method = getattr(Puzzle, name)
+
+    def profiled_method(self, *args, **kwargs):
+        """
+        Call the Puzzle method and record it
+        """
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException:
+            self._stats.record(name, 0, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        moves = 0
+        if isinstance(result, str):
+            moves = len(result)
+        elif name == "update_puzzle" or name == "update_puzzle_from":
+            moves = len(kwargs.get("move_string", args[-1] if args else ""))
+        self._stats.record(name, moves, seconds)
+        return result
+
+    profiled_method.__name__ = name
+    profiled_method.__doc__ = method.__doc__
+    return profiled_method
+
+
+class _ProfiledPuzzle(Puzzle):
+    """
+    Puzzle whose solver methods report to its SolverStats; see
+    Puzzle.enable_stats
+    """
+
+    __slots__ = ()
+
+
+for _method_name in _PROFILED_METHODS:
+    setattr(_ProfiledPuzzle, _method_name, _profiled(_method_name))
+
+
+##################################################################
+# Solution cache
+
+class _LRUStore:
+    """
+    Mapping that keeps the max_size most recently used entries and
+    counts hits, misses and evictions
+    """
+
+    __slots__ = ("_entries", "_max_size", "hits", "misses", "evictions")
+
+    def __init__(self, max_size):
+        """
+        Start empty
+        """
+        assert max_size > 0, "max_size must be positive"
+        self._max_size = max_size
+        self.clear()
+
+    def clear(self):
+        """
+        Drop all entries and counters
+        """
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Look up key and mark it as the most recently used
+        Returns the value, or None when key is absent
+        """
+        value = self._entries.get(key)
+        if value == None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store value under key, evicting the least recently used entry
+        when full
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def as_dict(self):
+        """
+        Export the counters
+        Returns a dictionary
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._entries), "max_size": self._max_size}
+
+
+class SolutionCache:
+    """
+    Transposition cache for solve_puzzle, shared between puzzles: whole
+    boards map to their solution, and two-row endgames (every row below
+    row one solved, blank on row one) map to the moves that finished
+    them. Keys are the dimensions plus the packed cells, and each level
+    is a bounded LRU
+    """
+
+    __slots__ = ("_boards", "_endgames")
+
+    def __init__(self, max_boards=4096, max_endgames=65536):
+        """
+        Start empty, holding at most max_boards boards and max_endgames
+        endgames
+        """
+        self._boards = _LRUStore(max_boards)
+        self._endgames = _LRUStore(max_endgames)
+
+    def get_board(self, key):
+        """
+        Look up a board key from Puzzle._board_key
+        Returns a move string, or None
+        """
+        return self._boards.get(key)
+
+    def put_board(self, key, moves):
+        """
+        Remember the solution of a board
+        """
+        self._boards.put(key, moves)
+
+    def get_endgame(self, key):
+        """
+        Look up an endgame key from Puzzle._endgame_key
+        Returns a move string, or None
+        """
+        return self._endgames.get(key)
+
+    def put_endgame(self, key, moves):
+        """
+        Remember the moves that finished an endgame
+        """
+        self._endgames.put(key, moves)
+
+    def as_dict(self):
+        """
+        Export hit, miss and eviction counters and sizes per level
+        Returns a dictionary of two dictionaries
+        """
+        return {"boards": self._boards.as_dict(), "endgames": self._endgames.as_dict()}
+
+    def clear(self):
+        """
+        Drop all entries and counters
+        """
+        self._boards.clear()
+        self._endgames.clear()
+
+
+##################################################################
+# Packed moves and solution archives
+
+# move codes of the packed encoding, four moves per byte, first move in
+# the low bits
+_PACK_TABLE = dict((first + second + third + fourth,
+                    _MOVES.index(first) | _MOVES.index(second) << 2
+                    | _MOVES.index(third) << 4 | _MOVES.index(fourth) << 6)
+                   for first in _MOVES for second in _MOVES
+                   for third in _MOVES for fourth in _MOVES)
+_UNPACK_TABLE = [None] * 256
+for _quad, _byte in _PACK_TABLE.items():
+    _UNPACK_TABLE[_byte] = _quad
+_DROP_MOVES = dict((ord(direction), None) for direction in _MOVES)
+
+
+def _packed_extents():
+    """
+    Where the blank goes over the four moves of each packed byte
+    Returns a list, indexed by byte, of (row step, column step, lowest
+    row, highest row, lowest column, highest column) tuples relative to
+    the blank's starting cell
+    """
+    extents = []
+    for byte in range(256):
+        row = col = 0
+        rows = []
+        cols = []
+        for shift in range(0, 8, 2):
+            step_row, step_col = _MOVE_STEPS[byte >> shift & 3]
+            row += step_row
+            col += step_col
+            rows.append(row)
+            cols.append(col)
+        extents.append((row, col, min(rows), max(rows), min(cols), max(cols)))
+    return extents
+
+
+_PACKED_EXTENTS = _packed_extents()
+
+_ARCHIVE_MAGIC = b"FSOL"
+_ARCHIVE_VERSION = 1
+# height, width and move count in front of each archive record
+_RECORD_HEADER = struct.Struct("<HHI")
+
+
+def encode_moves(move_string):
+    """
+    Pack a move string at two bits per move, after a little-endian
+    32-bit move count
+    Returns a bytes object
+    """
+    assert not move_string.translate(_DROP_MOVES), "invalid direction in " + repr(move_string)
+    count = len(move_string)
+    return struct.pack("<I", count) + _pack_moves(move_string)
+
+
+def decode_moves(data, offset=0):
+    """
+    Unpack moves written by encode_moves, starting at offset in data
+    (bytes, bytearray, memoryview or mmap); the result can be passed
+    straight to update_puzzle
+    Returns a string
+    """
+    count = struct.unpack_from("<I", data, offset)[0]
+    return _unpack_moves(data, offset + 4, count)
+
+
+def _pack_moves(move_string):
+    """
+    The two-bit codes of move_string, padded with "u" to whole bytes
+    Returns a bytes object
+    """
+    padded = move_string + "u" * (-len(move_string) % 4)
+    return bytes(_PACK_TABLE[padded[start:start + 4]] for start in range(0, len(padded), 4))
+
+
+def _unpack_moves(data, offset, count):
+    """
+    The first count moves packed in data from offset on
+    Returns a string
+    """
+    packed = data[offset:offset + (count + 3) // 4]
+    return "".join([_UNPACK_TABLE[byte] for byte in packed])[:count]
+
+
+class SolutionWriter:
+    """
+    Appends (height, width, board, packed solution) records to an
+    archive file as they come, so archives of any size are written
+    without holding them in memory. Each record is a _RECORD_HEADER,
+    the board cells little-endian in reading order and the moves packed
+    as by encode_moves
+    """
+
+    __slots__ = ("_file", "count")
+
+    def __init__(self, path):
+        """
+        Create (or truncate) the archive at path
+        """
+        self._file = open(path, "wb")
+        self._file.write(_ARCHIVE_MAGIC + struct.pack("<B", _ARCHIVE_VERSION))
+        self.count = 0
+
+    def write(self, puzzle, move_string):
+        """
+        Append the current board of puzzle with its solution
+        """
+        assert not move_string.translate(_DROP_MOVES), "invalid direction in " + repr(move_string)
+        height = puzzle.get_height()
+        width = puzzle.get_width()
+        cells = array(_cell_typecode(height * width), puzzle._cells)
+        if sys.byteorder == "big":
+            cells.byteswap()
+        self._file.write(_RECORD_HEADER.pack(height, width, len(move_string)))
+        self._file.write(cells.tobytes())
+        self._file.write(_pack_moves(move_string))
+        self.count += 1
+
+    def close(self):
+        """
+        Flush and close the file
+        """
+        self._file.close()
+
+    def __enter__(self):
+        """
+        Use the writer in a with statement
+        Returns the writer
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Close the file when the with statement ends
+        """
+        self.close()
+
+
+class SolutionArchive:
+    """
+    Read-only view of an archive written by SolutionWriter; records are
+    decoded from the mapped file one at a time
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        """
+        Wrap the archive bytes (normally a read-only mmap)
+        """
+        assert data[:4] == _ARCHIVE_MAGIC, "not a solution archive"
+        version = data[4]
+        assert version == _ARCHIVE_VERSION, "unknown solution archive version " + str(version)
+        self._data = data
+
+    def records(self):
+        """
+        Walk the archive without building puzzles
+        Returns an iterator of (height, width, cells array, packed moves
+        memoryview, move count) tuples
+        """
+        data = memoryview(self._data)
+        offset = 5
+        while offset < len(data):
+            height, width, count = _RECORD_HEADER.unpack_from(data, offset)
+            offset += _RECORD_HEADER.size
+            cells = array(_cell_typecode(height * width))
+            board_end = offset + height * width * cells.itemsize
+            cells.frombytes(data[offset:board_end])
+            if sys.byteorder == "big":
+                cells.byteswap()
+            offset = board_end + (count + 3) // 4
+            yield height, width, cells, data[board_end:offset], count
+
+    def __iter__(self):
+        """
+        Decode every record
+        Returns an iterator of (Puzzle, move string) pairs
+        """
+        for height, width, cells, packed, count in self.records():
+            cells = cells.tolist()
+            grid = [cells[row * width:(row + 1) * width] for row in range(height)]
+            yield Puzzle(height, width, grid), _unpack_moves(packed, 0, count)
+
+
+def load_solution_archive(path):
+    """
+    Map an archive written by SolutionWriter read-only into memory
+    Returns a SolutionArchive object
+    """
+    import mmap
+    with open(path, "rb") as in_file:
+        data = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return SolutionArchive(data)
+
+
+class SolutionReplay:
+    """
+    Replays a packed move stream from a board. A copy of the board is
+    kept every interval moves as the replay first passes it, so seeking
+    to any move index replays at most interval moves. Legality is checked
+    from the blank's path alone, four moves per packed byte, without
+    moving any tile
+    """
+
+    __slots__ = ("_start", "_packed", "_count", "_interval", "_snapshots",
+                 "_checked", "_check_blank", "_illegal")
+
+    def __init__(self, puzzle, packed, count, interval=_REPLAY_INTERVAL):
+        """
+        Replay the count moves packed (as by encode_moves, without the
+        count) in packed from the current board of puzzle
+        """
+        assert interval > 0 and interval % 4 == 0, "replay interval must be a positive multiple of 4"
+        assert len(packed) * 4 >= count, "packed moves are shorter than " + str(count)
+        self._start = puzzle.clone()
+        self._packed = packed
+        self._count = count
+        self._interval = interval
+        # snapshot i is the cells and blank offset after i * interval moves
+        self._snapshots = [(self._start._cells, self._start._tile_pos[0])]
+        # moves known to be legal, the blank's (row, col) after them and
+        # the index of the first illegal move once found
+        self._checked = 0
+        self._check_blank = divmod(self._start._tile_pos[0], puzzle.get_width())
+        self._illegal = None
+
+    def __len__(self):
+        """
+        Number of moves replayed
+        Returns an integer
+        """
+        return self._count
+
+    def first_illegal_move(self, end=None):
+        """
+        Check the moves before end (all of them by default); moves
+        already checked are not looked at again
+        Returns the index of the first move that leaves the board, or None
+        """
+        if end == None or end > self._count:
+            end = self._count
+        if self._illegal != None:
+            return self._illegal if self._illegal < end else None
+        height = self._start.get_height()
+        width = self._start.get_width()
+        packed = self._packed
+        extents = _PACKED_EXTENTS
+        index = self._checked
+        row, col = self._check_blank
+        while index < end:
+            if index & 3 == 0 and index + 4 <= end:
+                step_row, step_col, low_row, high_row, low_col, high_col = extents[packed[index >> 2]]
+                if (row + low_row >= 0 and row + high_row < height
+                        and col + low_col >= 0 and col + high_col < width):
+                    row += step_row
+                    col += step_col
+                    index += 4
+                    continue
+            # one move at a time within a byte that leaves the board or
+            # runs past end
+            step_row, step_col = _MOVE_STEPS[packed[index >> 2] >> 2 * (index & 3) & 3]
+            row += step_row
+            col += step_col
+            if not (0 <= row < height and 0 <= col < width):
+                self._illegal = index
+                return index
+            index += 1
+        if index > self._checked:
+            self._checked = index
+            self._check_blank = (row, col)
+        return None
+
+    def _replay(self, cells, zero, start, stop):
+        """
+        Apply the (legal) moves from index start, a multiple of 4, to
+        stop to cells with the blank at offset zero
+        Updates cells and returns the new blank offset
+        """
+        width = self._start.get_width()
+        steps = _offset_steps(width)
+        for direction in _unpack_moves(self._packed, start >> 2, stop - start):
+            target = zero + steps[direction]
+            cells[zero] = cells[target]
+            zero = target
+        cells[zero] = 0
+        return zero
+
+    def seek(self, index):
+        """
+        The board after the first index moves, replayed from the nearest
+        snapshot at or before index
+        Returns a Puzzle object
+        """
+        assert 0 <= index <= self._count, "move index out of range: " + str(index)
+        illegal = self.first_illegal_move(index)
+        assert illegal == None, "illegal move at index " + str(illegal)
+        interval = self._interval
+        snapshots = self._snapshots
+        while len(snapshots) <= index // interval:
+            start = (len(snapshots) - 1) * interval
+            cells = snapshots[-1][0][:]
+            zero = self._replay(cells, snapshots[-1][1], start, start + interval)
+            snapshots.append((cells, zero))
+        cells, zero = snapshots[index // interval]
+        cells = cells[:]
+        self._replay(cells, zero, index - index % interval, index)
+        puzzle = self._start.clone()
+        puzzle._cells = cells
+        puzzle._index_tiles()
+        return puzzle
+
+    def verify(self, end=None, expected=None):
+        """
+        Check that the first end moves (all by default) are legal and
+        take the board to that of the Puzzle expected, or to the solved
+        board when expected is None
+        Returns a boolean
+        """
+        if end == None:
+            end = self._count
+        if self.first_illegal_move(end) != None:
+            return False
+        board = self.seek(end)
+        if expected == None:
+            return board._solved_from == 0
+        return board._cells.tolist() == expected._cells.tolist()
+
+
+##################################################################
+# Batch solving
+
+_BATCH_METHODS = ("phased", "optimal", "bidirectional", "weighted")
+
+# per-process state of pool workers, set up by _init_solve_worker
+_WORKER_STATE = {"pattern_db": None}
+
+
+def _init_solve_worker(pattern_db_path):
+    """
+    Prepare a worker process; the pattern database file, if any, is
+    mapped once per process and its pages are shared between processes
+    """
+    if pattern_db_path != None:
+        _WORKER_STATE["pattern_db"] = load_pattern_database(pattern_db_path)
+    else:
+        _WORKER_STATE["pattern_db"] = None
+
+
+def _solve_job(job):
+    """
+    Solve one (index, grid, method) job, reporting a failure instead of
+    raising it so one bad board cannot stop the batch
+    Returns a tuple (index, move string or None, error message or None)
+    """
+    index, grid, method = job
+    try:
+        puzzle = Puzzle(len(grid), len(grid[0]), grid)
+        if not puzzle.is_solvable():
+            return (index, None, "puzzle is not solvable")
+        if method == "optimal":
+            move_string = puzzle.solve_optimal(_WORKER_STATE["pattern_db"])
+        elif method == "bidirectional":
+            move_string = puzzle.solve_bidirectional()
+        elif method == "weighted":
+            move_string = puzzle.solve_weighted()
+        else:
+            move_string = puzzle.solve_puzzle()
+    except Exception as error:
+        return (index, None, type(error).__name__ + ": " + str(error))
+    return (index, move_string, None)
+
+
+def _run_jobs(grids, workers, method, chunk_size, pattern_db_path, ordered):
+    """
+    Feed the grids to a process pool (or solve them in this process when
+    workers is 1), yielding _solve_job results
+    """
+    assert method in _BATCH_METHODS, "unknown method: " + str(method)
+    jobs = ((index, grid, method) for index, grid in enumerate(grids))
+    if workers == 1:
+        _init_solve_worker(pattern_db_path)
+        for job in jobs:
+            yield _solve_job(job)
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, _init_solve_worker, (pattern_db_path,))
+    try:
+        if ordered:
+            results = pool.imap(_solve_job, jobs, chunk_size)
+        else:
+            results = pool.imap_unordered(_solve_job, jobs, chunk_size)
+        for result in results:
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def solve_many(grids, workers=None, method="phased", chunk_size=16,
+               pattern_db_path=None):
+    """
+    Solve an iterable of boards (2D lists) on a pool of worker processes
+    (one per core by default), sending them in chunks of chunk_size.
+    method is "phased" for solve_puzzle, "optimal" for solve_optimal,
+    which uses the pattern database file at pattern_db_path if given,
+    "bidirectional" for solve_bidirectional or "weighted" for
+    solve_weighted with its defaults
+    Returns a list of (move string, error) tuples in input order; a
+    failed board has move string None and an error message
+    """
+    return [(move_string, error) for dummy_index, move_string, error
+            in _run_jobs(grids, workers, method, chunk_size, pattern_db_path, True)]
+
+
+def solve_as_completed(grids, workers=None, method="phased", chunk_size=16,
+                       pattern_db_path=None):
+    """
+    Like solve_many, but hands back each board as soon as it is solved
+    Yields a tuple (input index, move string or None, error or None)
+    """
+    for result in _run_jobs(grids, workers, method, chunk_size,
+                            pattern_db_path, False):
+        yield result
+
+
+##################################################################
+# Parallel subtree search
+
+# per-process state of solve_parallel workers, set up by _init_subtree_worker
+_SUBTREE_STATE = {"pattern_db": None, "stop": None}
+
+
+def _init_subtree_worker(pattern_db_path, stop):
+    """
+    Prepare a solve_parallel worker: map the pattern database file, if
+    any, and keep the shared stop flag
+    """
+    _init_solve_worker(pattern_db_path)
+    _SUBTREE_STATE["pattern_db"] = _WORKER_STATE["pattern_db"]
+    _SUBTREE_STATE["stop"] = stop
+
+
+def _search_subtree(job):
+    """
+    Run one IDA* threshold iteration below a frontier board, given as
+    (cells, blank, previous, path, height, width, bound). Finding a
+    solution sets the shared stop flag; a set flag abandons the search
+    Returns a tuple (-1 and the full move string when solved, or the
+    smallest cost over bound (None if none, or if stopped) and None)
+    """
+    cells, blank, previous, path, height, width, bound = job
+    stop = _SUBTREE_STATE["stop"]
+    if stop.value:
+        return (None, None)
+    if _SUBTREE_STATE["pattern_db"] == None:
+        estimator = _ConflictEstimate(cells, height, width)
+    else:
+        estimator = _PatternEstimate(cells, _SUBTREE_STATE["pattern_db"])
+    moves = list(path)
+    search = _bounded_search(cells, _neighbour_table(height, width), estimator,
+                             moves, stop)
+    try:
+        result = search(blank, len(path), bound, estimator.initial, previous)
+    except _SearchStopped:
+        return (None, None)
+    if result == -1:
+        stop.value = 1
+        return (-1, "".join(moves))
+    return (result, None)
+
+
+def _run_subtrees(frontier, height, width, workers, pattern_db_path):
+    """
+    Threshold iterations of IDA* over the subtrees of frontier, a list
+    of (cells, blank, previous, path) nodes all at the same depth, on a
+    process pool (or in this process when workers is 1)
+    Returns a move string
+    """
+    import multiprocessing
+    stop = multiprocessing.Value("b", 0)
+    if workers == 1:
+        _init_subtree_worker(pattern_db_path, stop)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, _init_subtree_worker, (pattern_db_path, stop))
+    try:
+        # every frontier board is at the same depth, so a first pass with
+        # that bound just collects their smallest estimate
+        bound = len(frontier[0][3])
+        while True:
+            stop.value = 0
+            jobs = [(cells, blank, previous, path, height, width, bound)
+                    for cells, blank, previous, path in frontier]
+            if pool == None:
+                results = (_search_subtree(job) for job in jobs)
+            else:
+                results = pool.imap_unordered(_search_subtree, jobs)
+            smallest = None
+            for result, move_string in results:
+                if result == -1:
+                    return move_string
+                if result != None and (smallest == None or result < smallest):
+                    smallest = result
+            assert smallest != None, "no solution found"
+            bound = smallest
+    finally:
+        if pool != None:
+            pool.terminate()
+            pool.join()
+
+
+##################################################################
+# Vectorized batch boards
+
+# BoardBatch direction codes index _MOVES, with the code len(_MOVES)
+# meaning no move. NumPy step tables for those codes and the byte ->
+# direction code table, built by _batch_tables on first use
+_BATCH_TABLES = {}
+
+
+def _batch_tables(numpy):
+    """
+    The row steps, column steps and a 256-entry table mapping each
+    ASCII byte to its direction code, or -1 for bytes that are not
+    moves, as NumPy arrays
+    Returns a tuple of three arrays
+    """
+    if not _BATCH_TABLES:
+        codes = numpy.full(256, -1, dtype=numpy.intp)
+        for code, direction in enumerate(_MOVES):
+            codes[ord(direction)] = code
+        steps = _MOVE_STEPS + ((0, 0),)
+        _BATCH_TABLES["row_step"] = numpy.array([row for row, col in steps], dtype=numpy.intp)
+        _BATCH_TABLES["col_step"] = numpy.array([col for row, col in steps], dtype=numpy.intp)
+        _BATCH_TABLES["codes"] = codes
+    return _BATCH_TABLES["row_step"], _BATCH_TABLES["col_step"], _BATCH_TABLES["codes"]
+
+
+class BoardBatch:
+    """
+    Many boards of one size held as an (N, height * width) NumPy array
+    plus a vector of blank offsets, so moves and checks run across all
+    boards at once. Needs NumPy, which is imported on first use
+    """
+
+    __slots__ = ("_np", "_height", "_width", "_cells", "_blanks", "_legal")
+
+    def __init__(self, puzzle_height, puzzle_width, grids):
+        """
+        Stack grids (2D lists, or Puzzle objects) into one array
+        Returns a BoardBatch object
+        """
+        import numpy
+        self._np = numpy
+        self._height = puzzle_height
+        self._width = puzzle_width
+        dtype = {"B": numpy.uint8, "H": numpy.uint16,
+                 "I": numpy.uint32}[_cell_typecode(puzzle_height * puzzle_width)]
+        rows = []
+        for grid in grids:
+            if isinstance(grid, Puzzle):
+                rows.append(grid._cells.tolist())
+            else:
+                rows.append([tile for row in grid for tile in row])
+        self._cells = numpy.array(rows, dtype=dtype).reshape(len(rows), puzzle_height * puzzle_width)
+        self._blanks = numpy.argmin(self._cells, axis=1)
+        self._legal = numpy.ones(len(rows), dtype=bool)
+
+    def __len__(self):
+        """
+        Number of boards
+        Returns an integer
+        """
+        return len(self._cells)
+
+    def get_cells(self):
+        """
+        The (N, height * width) array of tiles in reading order
+        Returns a NumPy array
+        """
+        return self._cells
+
+    def get_puzzle(self, index):
+        """
+        Copy one board out of the batch
+        Returns a Puzzle object
+        """
+        cells = self._cells[index].tolist()
+        width = self._width
+        return Puzzle(self._height, width,
+                      [cells[row * width:(row + 1) * width] for row in range(self._height)])
+
+    def legal(self):
+        """
+        Which boards have only been given moves that stayed on the grid;
+        a board stops moving at its first illegal move
+        Returns a boolean NumPy array
+        """
+        return self._legal
+
+    def step(self, codes):
+        """
+        Move every board's blank one step; codes holds one direction
+        index into "udlr" per board, or 4 to leave that board alone
+        """
+        numpy = self._np
+        row_step, col_step, dummy_codes = _batch_tables(numpy)
+        codes = numpy.asarray(codes, dtype=numpy.intp)
+        rows, cols = numpy.divmod(self._blanks, self._width)
+        rows = rows + row_step[codes]
+        cols = cols + col_step[codes]
+        on_grid = ((rows >= 0) & (rows < self._height)
+                   & (cols >= 0) & (cols < self._width))
+        self._legal &= on_grid | (codes == len(_MOVES))
+        moving = numpy.nonzero(self._legal & on_grid
+                               & (codes != len(_MOVES)))[0]
+        blanks = self._blanks[moving]
+        targets = rows[moving] * self._width + cols[moving]
+        self._cells[moving, blanks] = self._cells[moving, targets]
+        self._cells[moving, targets] = 0
+        self._blanks[moving] = targets
+
+    def update_puzzles(self, move_strings):
+        """
+        Apply one move string per board, step by step across the batch;
+        shorter strings simply stop moving their board
+        """
+        numpy = self._np
+        code_table = _batch_tables(numpy)[2]
+        length = max([len(moves) for moves in move_strings] + [0])
+        codes = numpy.full((len(move_strings), length), len(_MOVES),
+                           dtype=numpy.intp)
+        for index, moves in enumerate(move_strings):
+            # non-ASCII characters become "?", which is not a move either
+            row_codes = code_table[numpy.frombuffer(moves.encode("ascii", "replace"), numpy.uint8)]
+            invalid = numpy.nonzero(row_codes < 0)[0]
+            assert not len(invalid), ("invalid direction " + repr(moves[invalid[0]])
+                                      + " at " + str(invalid[0]) + " in move string " + str(index))
+            codes[index, :len(moves)] = row_codes
+        for column in range(length):
+            self.step(codes[:, column])
+
+    def current_position(self, solved_row, solved_col):
+        """
+        Locate, on every board, the tile that belongs at
+        (solved_row, solved_col) when solved
+        Returns a tuple of two NumPy arrays (rows, cols)
+        """
+        solved_value = solved_col + self._width * solved_row
+        if solved_value == 0:
+            offsets = self._blanks
+        else:
+            offsets = self._np.argmax(self._cells == solved_value, axis=1)
+        return self._np.divmod(offsets, self._width)
+
+    def _holds(self, zero_offset, solved_offsets):
+        """
+        Which boards have the blank at zero_offset and the solved tile
+        on every offset in solved_offsets
+        Returns a boolean NumPy array
+        """
+        numpy = self._np
+        solved_offsets = numpy.asarray(solved_offsets, dtype=numpy.intp)
+        return ((self._blanks == zero_offset)
+                & (self._cells[:, solved_offsets] == solved_offsets).all(axis=1))
+
+    def is_solved(self):
+        """
+        Which boards are in the solved configuration
+        Returns a boolean NumPy array
+        """
+        return self._holds(0, range(self._height * self._width))
+
+    def lower_row_invariant(self, target_row, target_col):
+        """
+        Which boards have the blank at (target_row, target_col), the rest
+        of that row solved and every row below it solved
+        Returns a boolean NumPy array
+        """
+        zero_offset = target_col + self._width * target_row
+        return self._holds(zero_offset, range(zero_offset + 1, self._height * self._width))
+
+    def row0_invariant(self, target_col):
+        """
+        Which boards have the blank at (0, target_col), row 0 right of it
+        and row 1 from target_col on solved, and every lower row solved
+        Returns a boolean NumPy array
+        """
+        width = self._width
+        solved_offsets = (list(range(target_col + 1, width))
+                          + list(range(width + target_col, self._height * width)))
+        return self._holds(target_col, solved_offsets)
+
+    def row1_invariant(self, target_col):
+        """
+        Which boards have the blank at (1, target_col), rows 0 and 1 right
+        of target_col solved, and every lower row solved
+        Returns a boolean NumPy array
+        """
+        width = self._width
+        solved_offsets = (list(range(target_col + 1, width))
+                          + list(range(width + target_col + 1, self._height * width)))
+        return self._holds(width + target_col, solved_offsets)
 
-        return total_moves
-                  
 
 # Start interactive simulation
 #poc_fifteen_gui.FifteenGUI(Puzzle(4, 4))